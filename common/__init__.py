@@ -0,0 +1,2 @@
+# modules shared by labs: lab_3 and lab_4 use all of them but input_data (lab_4 reads xlsx, see lab_4/read_data.py),
+# lab_2 has its own bases and models and uses system_solve, stages, input_data and degree_cache only
@@ -0,0 +1,97 @@
+"""
+Bootstrap confidence bands of reconstructed F_ and of predicted Y. Every replicate refits Lamb, a and c
+(see Solve.refit) on resampled samples or on F plus resampled residuals; workers build A and factor it once
+and share it between all their replicates.
+Usage: XF, x = solver.forecast_points(steps)  # forecast_points() in lab_4
+       bands = confidence_bands(solver, 500, points=x)
+"""
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+MODES = ('rows', 'residuals')
+
+_solver = None  # fitted copy of Solve in worker process
+_points = None  # points of prediction
+
+
+def _init_worker(cls, inputs, points):
+    global _solver, _points
+    _solver = cls.__new__(cls)
+    _solver.__dict__.update(inputs)
+    _solver.compute('built_F')
+    _points = points
+
+
+def _release_worker():
+    global _solver, _points
+    _solver = _points = None
+
+
+def _replicates(args):
+    """
+    :param args: tuple (seeds, mode), one replicate for every seed
+    :return: tuple (F_ of replicates (r, n, outputs), predictions of replicates (r, m, outputs) or None)
+    """
+    seeds, mode = args
+    F_, predicted = [], []
+    for seed in seeds:
+        fit = resample(_solver, mode, np.random.RandomState(seed))
+        F_.append(fit.F_)
+        if _points is not None:
+            predicted.append(fit.calculate_values(_points))
+    return np.array(F_), np.array(predicted) if _points is not None else None
+
+
+def resample(a, mode, rng):
+    """
+    :param a: fitted Solve
+    :param mode: 'rows' refits on samples drawn with replacement, 'residuals' refits on F plus residuals Y - F
+    drawn with replacement (rows of residuals are drawn, so outputs keep their correlation)
+    :param rng: numpy RandomState
+    :return: refitted copy of a
+    """
+    n = a.Y.shape[0]
+    if mode == 'rows':
+        return a.refit(rows=np.sort(rng.randint(n, size=n)))
+    if mode == 'residuals':
+        return a.refit(Y=a.F + (a.Y - a.F)[rng.randint(n, size=n)])
+    raise ValueError('Unknown bootstrap mode %s, use one of %s' % (mode, MODES))
+
+
+def confidence_bands(a, replicates=200, mode='rows', points=None, level=0.95, processes=None, seed=None):
+    """
+    Percentile bootstrap bands
+    :param a: Solve, its data and parameters are sent to every worker once
+    :param replicates: number of refits
+    :param mode: name from MODES, see resample
+    :param points: array (m, mX) of points in original scale to predict Y in (e.g. of Solve.forecast_points),
+    None for bands of F_ only
+    :param level: confidence level of bands
+    :param processes: number of worker processes, by default number of CPUs; 1 refits in this process
+    :param seed: seed of resampling
+    :return: dict with 'F_' -> ndarray (2, n, outputs) of lower and upper bounds of F_ and, when points are given,
+    'predicted' -> ndarray (2, m, outputs) of bounds of predictions in rows of points
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown bootstrap mode %s, use one of %s' % (mode, MODES))
+    processes = processes or cpu_count()
+    points = None if points is None else np.array(points, dtype=float, ndmin=2)
+    seeds = np.random.RandomState(seed).randint(2 ** 31 - 1, size=replicates)
+    # replicates of a chunk share the worker, about 4 chunks per worker balance the load
+    tasks = [(chunk, mode) for chunk in np.array_split(seeds, min(replicates, 4 * processes)) if len(chunk)]
+    if processes == 1:
+        a.compute('built_F')
+        _init_worker(type(a), a.__dict__, points)
+        try:
+            results = list(map(_replicates, tasks))
+        finally:
+            _release_worker()  # worker state of this process would keep data and A alive
+    else:
+        with Pool(processes, _init_worker, (type(a), a.inputs(), points)) as pool:
+            results = pool.map(_replicates, tasks, 1)
+    q = [50 * (1 - level), 50 * (1 + level)]
+    bands = {'F_': np.percentile(np.concatenate([F_ for F_, _ in results]), q, axis=0)}
+    if points is not None:
+        bands['predicted'] = np.percentile(np.concatenate([p for _, p in results]), q, axis=0)
+    return bands
@@ -0,0 +1,287 @@
+import numpy as np
+from copy import copy
+from itertools import product
+from math import ceil, log
+from multiprocessing import Pool, cpu_count
+
+from common.degree_cache import DegreeCache
+
+_solver = None  # copy of Solve in worker process
+_datas = None  # all samples of _solver, fits on subsamples take rows of it
+_samples = None  # number of samples _solver is fitted on now, None for all
+
+
+def _init_worker(cls, inputs):
+    global _solver, _datas, _samples
+    _solver = cls.__new__(cls)
+    _solver.__dict__.update(inputs)
+    _datas = _solver.datas
+    _samples = None
+
+
+def _release_worker():
+    global _solver, _datas, _samples
+    _solver = _datas = _samples = None
+
+
+def _brute(args):
+    global _samples
+    i, j, k, samples = args
+    if samples != _samples:  # data is normalized again and basis is rebuilt, so tasks come grouped by samples
+        _samples = samples
+        _solver.datas = _datas if samples is None else _datas[subsample(len(_datas), samples)]
+    _solver.deg = [i + 1, j + 1, k + 1]  # stages from built_A on are recomputed when norm_error is read
+    return _result((i, j, k), _solver.norm_error, _solver.cv_error)
+
+
+def _result(combination, norm_error, cv_error):
+    """
+    :return: (combination, error, norm_error, cv_error), combinations are compared by error, that is
+    the largest out-of-sample error when model is cross-validated and the largest norm_error otherwise
+    """
+    return combination, np.linalg.norm(norm_error if cv_error is None else cv_error, np.inf), norm_error, cv_error
+
+
+def subsample(n, samples):
+    """
+    :param n: number of all samples
+    :param samples: number of samples to take
+    :return: indices of samples evenly spread over all of them, so every part of time series is kept
+    """
+    return np.linspace(0, n - 1, samples).round().astype(int)
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+class DegreeSearch(object):
+    """
+    Fits of combinations of degrees requested by search strategy, every combination is fitted once
+    :param run: function(tasks) -> iterator of results of _brute in order of tasks
+    :param samples: number of samples of the model
+    :param min_samples: least number of samples for fit on subsample
+    :param budget: maximal number of fits, None for unlimited
+    :param listener: function(search, result, samples) called after every fit, the only report of progress
+    :param stop: function() -> True when search has to be cancelled, checked after every fit
+    :param total: expected number of fits, for progress
+    :param known: dict (combination, samples) -> (norm_error, cv_error) of fits done before, they are not fitted again
+    :param save: function(combination, samples, norm_error, cv_error) called for every new fit
+    """
+
+    def __init__(self, run, samples, min_samples, budget=None, listener=None, stop=None, total=None, known=None,
+                 save=None):
+        self.run = run
+        self.samples = samples
+        self.min_samples = min(min_samples, samples)
+        self.budget = budget
+        self.listener = listener
+        self.stop = stop
+        self.total = total
+        self.known = known or {}
+        self.save = save
+        self.results = {}  # (combination, samples) -> result of _brute, in order of fits
+        self.fits = 0
+        self.reused = 0  # results taken from known
+        self.best_result = None  # first best result on all samples
+
+    def remaining(self):
+        return float('inf') if self.budget is None else self.budget - self.fits
+
+    def evaluate(self, combinations, samples=None):
+        """
+        Fits combinations that were not fitted yet, while budget allows, known results do not use budget
+        :param combinations: list of (i, j, k)
+        :param samples: fit on this number of samples (see subsample), None for all
+        :return: list of results (combination, error, norm_error, cv_error) for fitted combinations in order of them
+        """
+        if samples is not None and samples >= self.samples:
+            samples = None
+        new = []
+        for combination in combinations:
+            if (combination, samples) in self.results or combination in new:
+                continue
+            if (combination, samples) in self.known:
+                self.reused += 1
+                self._record(_result(combination, *self.known[(combination, samples)]), samples)
+            else:
+                new.append(combination)
+        if len(new) > self.remaining():
+            new = new[:int(self.remaining())]
+        for combination, result in zip(new, self.run([combination + (samples,) for combination in new])):
+            self.fits += 1
+            if self.save is not None:
+                self.save(combination, samples, result[2], result[3])
+            self._record(result, samples)
+        return [self.results[(c, samples)] for c in combinations if (c, samples) in self.results]
+
+    def _record(self, result, samples):
+        self.results[(result[0], samples)] = result
+        if samples is None and (self.best_result is None or result[1] < self.best_result[1]):
+            self.best_result = result
+        if self.listener is not None:
+            self.listener(self, result, samples)
+        if self.stop is not None and self.stop():
+            raise SearchCancelled()
+
+    def best(self):
+        """
+        :return: first best result among fits on all samples, if search was cancelled before any of them,
+        the best result on the largest subsample; None if nothing was fitted
+        """
+        if self.best_result is not None or not self.results:
+            return self.best_result
+        largest = max(samples for _, samples in self.results)
+        return min((result for (_, samples), result in self.results.items() if samples == largest),
+                   key=lambda result: result[1])
+
+
+def _grid(search, p, rng):
+    """
+    All combinations from p1 x p2 x p3 in order of product, budget is not used
+    """
+    search.budget = None
+    search.evaluate(list(product(*p)))
+
+
+def _random(search, p, rng):
+    """
+    Combinations drawn from p1 x p2 x p3 without repetition
+    """
+    grid = list(product(*p))
+    count = int(min(search.remaining(), len(grid)))
+    search.evaluate([grid[index] for index in rng.permutation(len(grid))[:count]])
+
+
+def _latin_hypercube(p, count, rng):
+    """
+    :param p: lists of degrees for X1, X2, X3
+    :param count: number of points
+    :return: combinations, every degree list is split in count strata and each stratum is used once
+    """
+    columns = [np.array(values)[((rng.permutation(count) + rng.rand(count)) * len(values) / count).astype(int)]
+               for values in p]
+    combinations = []
+    for combination in zip(*(column.tolist() for column in columns)):
+        if combination not in combinations:  # strata are narrower than step of degrees when count > len(values)
+            combinations.append(combination)
+    return combinations
+
+
+def _latin(search, p, rng):
+    """
+    Latin hypercube sample of p1 x p2 x p3
+    """
+    count = int(min(search.remaining(), len(p[0]) * len(p[1]) * len(p[2])))
+    search.evaluate(_latin_hypercube(p, count, rng))
+
+
+def _coordinate(search, p, rng):
+    """
+    Coordinate descent: degree of one vector is optimized at a time while others are fixed, until no degree changes.
+    Starts from the middle of ranges, then from random points while budget remains.
+    """
+    grid = list(product(*p))
+    start = tuple(values[len(values) // 2] for values in p)
+    while start is not None and search.remaining() > 0:
+        best = search.evaluate([start])[0]
+        moved = True
+        while moved and search.remaining() > 0:
+            moved = False
+            for axis, values in enumerate(p):
+                current = best[0]
+                # nearest degrees first, so they are fitted when budget ends in the middle of the line
+                line = [current[:axis] + (value,) + current[axis + 1:]
+                        for value in sorted(values, key=lambda value: abs(value - current[axis]))]
+                for result in search.evaluate(line):
+                    if result[1] < best[1]:
+                        best, moved = result, True
+        if search.budget is None:
+            break
+        fresh = [combination for combination in grid if (combination, None) not in search.results]
+        start = fresh[rng.randint(len(fresh))] if fresh else None
+
+
+def _halving(search, p, rng, eta=3):
+    """
+    Successive halving: many combinations are fitted on small subsamples, and the best 1/eta of them
+    go to the next round on eta times more samples, the last round is fitted on all samples
+    """
+    size = len(p[0]) * len(p[1]) * len(p[2])
+    budget = size if search.budget is None else search.budget
+    # rounds fit count, count/eta, count/eta^2, ... combinations, less than count*eta/(eta-1) in total
+    count = max(1, min(size, int(budget * (eta - 1) / eta)))
+    candidates = list(product(*p)) if count == size else _latin_hypercube(p, count, rng)
+    rounds = int(log(len(candidates)) / log(eta)) if len(candidates) > 1 else 0
+    for k in range(rounds, -1, -1):
+        samples = max(search.min_samples, ceil(search.samples / eta ** k))
+        results = sorted(search.evaluate(candidates, samples if k else None), key=lambda result: result[1])
+        candidates = [result[0] for result in results[:max(1, len(candidates) // eta)]]
+
+
+# names of strategies for determine_deg, in order of items of strategy combobox in bruteforce_window.ui
+STRATEGIES = {
+    'grid': _grid,
+    'coordinate': _coordinate,
+    'halving': _halving,
+    'random': _random,
+    'latin': _latin,
+}
+
+
+def determine_deg(a, p1, p2, p3, processes=None, chunksize=None, strategy='grid', budget=None, seed=None,
+                  listener=None, stop=None, cache=None, folds=0, cv_mode='kfold'):
+    """
+    Finds degrees with minimal normalized error among combinations from p1 x p2 x p3
+    :param a: Solve, its data and parameters are sent to every worker once; a itself is not changed
+    :param processes: number of worker processes, by default number of CPUs; 1 searches in this process
+    :param chunksize: combinations sent to worker at once, by default about 4 chunks per worker
+    :param strategy: name from STRATEGIES: 'grid' fits all combinations, 'coordinate' is coordinate descent,
+    'halving' is successive halving on subsamples of data, 'random' and 'latin' fit random or Latin hypercube sample
+    :param budget: maximal number of fits (on all samples or on subsample), None to fit until strategy stops
+    :param seed: seed of random choices of strategy
+    :param listener: function(search, result, samples) called after every fit, see DegreeSearch
+    :param stop: function() -> True to cancel search, it is checked after every fit
+    :param cache: path of DegreeCache, results stored there for the same data and parameters are not fitted again
+    :param folds: number of folds of cross-validation (see Solve.cross_validate), combinations are compared by
+    out-of-sample error then; 0 compares them by in-sample norm_error
+    :param cv_mode: 'kfold' or 'time'
+    :return: ((i, j, k), error, norm_error, cv_error) of the first best combination among fitted on all samples,
+    when search is cancelled the best one fitted before (see DegreeSearch.best)
+    """
+    a = copy(a)  # folds, cv_mode and max_deg of the search do not stay on the solver of caller
+    a.folds, a.cv_mode = folds, cv_mode
+    a.compute('norm_data')
+    a.max_deg = [max(p1) + 1, max(p2) + 1, max(p3) + 1]  # A and its Gram matrix are built once for all combinations
+    processes = processes or cpu_count()
+    # fit on fewer samples than columns of the largest basis would be interpolation
+    min_samples = sum(a.dim[i] * a.max_deg[i] for i in range(3)) + 1
+    rng = np.random.RandomState(seed)
+    p = [list(p1), list(p2), list(p3)]
+    size = len(p[0]) * len(p[1]) * len(p[2])
+    total = size if budget is None or strategy == 'grid' else budget
+
+    store = DegreeCache(cache) if cache else None
+    key = store.key(a) if store else None
+
+    def search_with(run):
+        search = DegreeSearch(run, len(a.datas), min_samples, budget, listener, stop, total,
+                              store.load(key) if store else None,
+                              (lambda *fit: store.store(key, *fit)) if store else None)
+        try:
+            STRATEGIES[strategy](search, p, rng)
+        except SearchCancelled:
+            pass  # leaving the with block below terminates workers
+        finally:
+            if store:
+                store.close()
+        return search.best()
+
+    if processes == 1:
+        _init_worker(type(a), a.inputs())
+        try:
+            return search_with(lambda tasks: map(_brute, tasks))
+        finally:
+            _release_worker()  # worker state of this process would keep data and basis alive
+    with Pool(processes, _init_worker, (type(a), a.inputs())) as pool:
+        return search_with(lambda tasks: pool.imap(_brute, tasks, chunksize or max(1, len(tasks) // (4 * processes))))
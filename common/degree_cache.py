@@ -0,0 +1,80 @@
+"""
+Errors of fitted combinations of degrees kept on disk, so searches on the same data and parameters
+skip combinations fitted before and an interrupted search resumes where it stopped
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_PATH = 'degree_cache.sqlite'
+
+
+class DegreeCache(object):
+    """
+    Table of norm_error and cv_error of fits by key of model, degrees and number of samples of fit (0 for all)
+    :param path: file of sqlite database, created if missing
+    :param interval: seconds between commits, results of the last interval are lost if process is killed
+    """
+
+    def __init__(self, path=DEFAULT_PATH, interval=1.):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT, i INTEGER, j INTEGER, k INTEGER, '
+                                'samples INTEGER, norm_error TEXT, cv_error TEXT, PRIMARY KEY (key, i, j, k, samples))')
+        if 'cv_error' not in [column[1] for column in self.connection.execute('PRAGMA table_info(results)')]:
+            self.connection.execute('ALTER TABLE results ADD COLUMN cv_error TEXT')  # file of older version
+        self.interval = interval
+        self.committed = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key(solver):
+        """
+        :param solver: Solve with data loaded
+        :return: hash of data, class and parameters of solver named in its CACHE_PARAMS
+        """
+        datas = np.ascontiguousarray(solver.datas, dtype=float)
+        params = [type(solver).__name__, datas.shape] + [str(getattr(solver, name, None))
+                                                          for name in solver.CACHE_PARAMS]
+        digest = hashlib.sha1(json.dumps(params, default=str).encode())
+        digest.update(datas.tobytes())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        :param key: key of model
+        :return: dict (combination, samples) -> (norm_error, cv_error), samples is None for fits on all samples
+        """
+        rows = self.connection.execute('SELECT i, j, k, samples, norm_error, cv_error FROM results WHERE key = ?',
+                                       (key,))
+        return {((i, j, k), samples or None): (json.loads(norm_error), json.loads(cv_error or 'null'))
+                for i, j, k, samples, norm_error, cv_error in rows}
+
+    def store(self, key, combination, samples, norm_error, cv_error=None):
+        """
+        :param combination: degrees (i, j, k)
+        :param samples: number of samples of fit, None for all
+        :param norm_error: list of errors for outputs
+        :param cv_error: list of out-of-sample errors for outputs, None without cross-validation
+        """
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (key,) + tuple(int(d) for d in combination) +
+                                (samples or 0, json.dumps([float(e) for e in norm_error]),
+                                 json.dumps(None if cv_error is None else [float(e) for e in cv_error])))
+        if time.time() - self.committed > self.interval:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.committed = time.time()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
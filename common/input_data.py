@@ -0,0 +1,78 @@
+import io
+import mmap
+import os
+
+import numpy as np
+
+__author__ = 'strike'
+
+_cache = {}  # real path of file -> (mtime, size, parsed rows, True if all rows of file are parsed)
+
+
+def read_data(filename='data_2.txt', samples=None, columns=None):
+    """
+    Reads table of numbers separated by whitespace, one sample per line. File is memory-mapped and only lines
+    of the requested samples are parsed, in one call; parsed rows are kept while mtime and size of file are the same
+    :param filename: path of file
+    :param samples: number of first rows to return, None for all
+    :param columns: number of first columns that are checked for NaN, infinite and constant values,
+    by default all
+    :return: read-only ndarray (samples, columns of file), shared by calls for the same file
+    :raise ValueError: if file has less rows or columns, rows have different lengths, a value is not a number,
+    or a checked column has NaN, infinite or constant values
+    """
+    path = os.path.realpath(filename)
+    stat = os.stat(path)
+    cached = _cache.get(path)
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size) or \
+            not cached[3] and (samples is None or samples > len(cached[2])):
+        data, complete = _parse(path, samples)
+        cached = _cache[path] = (stat.st_mtime_ns, stat.st_size, data, complete)
+    data = cached[2] if samples is None else cached[2][:samples]
+    _validate(data, filename, samples, columns)
+    return data
+
+
+def _parse(path, samples):
+    """
+    :return: (read-only ndarray of parsed rows, True if all rows of file were parsed)
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.empty((0, 0)), True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            end = len(mapped)
+            if samples is not None:  # bytes of first samples lines only
+                end = -1
+                for _ in range(samples):
+                    end = mapped.find(b'\n', end + 1)
+                    if end < 0:
+                        break
+                end = len(mapped) if end < 0 else end
+            complete = end == len(mapped)
+            text = mapped[:end].strip()
+    if not text:
+        return np.empty((0, 0)), complete
+    try:  # loadtxt checks number of values of every row
+        data = np.loadtxt(io.BytesIO(text), ndmin=2, comments=None)
+    except ValueError as error:
+        raise ValueError('%s: %s' % (path, error))
+    data.flags.writeable = False
+    return data, complete
+
+
+def _validate(data, filename, samples, columns):
+    if samples is not None and len(data) < samples:
+        raise ValueError('%s has %d rows, %d samples requested' % (filename, len(data), samples))
+    if columns is not None and data.shape[1] < columns:
+        raise ValueError('%s has %d columns, %d expected' % (filename, data.shape[1], columns))
+    if not len(data):
+        return
+    checked = data[:, :columns]
+    problems = []
+    for name, bad in (('NaN or infinite values', ~np.isfinite(checked).all(axis=0)),
+                      ('constant values', checked.min(axis=0) == checked.max(axis=0))):
+        if bad.any():
+            problems.append('%s in columns %s' % (name, (np.flatnonzero(bad) + 1).tolist()))
+    if problems:
+        raise ValueError('%s has %s' % (filename, ', '.join(problems)))
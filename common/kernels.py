@@ -0,0 +1,190 @@
+"""
+Compiled kernels for the hot loops of Solve: filling of matrix A, sums of Psi and F1i and calculation of the
+model in given points. Kernels are compiled with Numba when it is installed (ENABLED), otherwise Solve keeps
+its NumPy implementation and these functions are never called.
+"""
+from functools import lru_cache
+import threading
+
+import numpy as np
+
+import common.basis_generator as b_gen
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ENABLED = numba is not None
+
+# transforms of aggregate functions: log(1 + x + OFFSET) for Solve, tanh(x) for SolveExpTh,
+# 2/pi*arctan(x) for SolveExpTh1
+LOG = 0
+TANH = 1
+ARCTAN = 2
+
+
+def _jit(func):
+    # cache=True keeps machine code in __pycache__, so only the very first launch compiles
+    return numba.njit(cache=True, nogil=True)(func) if ENABLED else func
+
+
+@lru_cache(maxsize=None)
+def coefficients(poly_type, count):
+    """
+    Recurrence of basis_generator.RECURRENCES as arrays for kernels
+    :param poly_type: key of RECURRENCES
+    :param count: number of polynomials (max degree + 1)
+    :return: tuple of arrays (alpha, beta, gamma, scale), P[k+1] = (alpha[k]*x + beta[k])*P[k] - gamma[k]*P[k-1]
+    and basis function k is P[k]*scale[k]
+    """
+    recurrence, scale = b_gen.RECURRENCES[poly_type]
+    steps = np.array([recurrence(k) for k in range(max(count - 1, 1))], dtype=float).reshape(-1, 3)
+    scales = np.array([scale(k) if scale else 1. for k in range(count)], dtype=float)
+    return steps[:, 0].copy(), steps[:, 1].copy(), steps[:, 2].copy(), scales
+
+
+@_jit
+def _fill_basis(x, alpha, beta, gamma, scale, out):
+    n, m = x.shape
+    count = out.shape[2]
+    for i in range(n):
+        for s in range(m):
+            prev = 0.
+            cur = 1.
+            out[i, s, 0] = scale[0]
+            for k in range(count - 1):
+                nxt = (alpha[k] * x[i, s] + beta[k]) * cur - gamma[k] * prev
+                prev = cur
+                cur = nxt
+                out[i, s, k + 1] = cur * scale[k + 1]
+
+
+@_jit
+def _segment_dot(M, W, lengths, out):
+    outputs, n, segments = out.shape
+    for r in range(outputs):
+        mat = M[r] if M.shape[0] > 1 else M[0]
+        for i in range(n):
+            q = 0
+            for s in range(segments):
+                acc = 0.
+                for d in range(lengths[s]):
+                    acc += mat[i, q + d] * W[q + d, r]
+                out[r, i, s] = acc
+                q += lengths[s]
+
+
+@_jit
+def _transform(value, family, offset):
+    if family == TANH:
+        return np.tanh(value)
+    if family == ARCTAN:
+        return 2 / np.pi * np.arctan(value)
+    return np.log(1 + value + offset)
+
+
+@_jit
+def _evaluate(X, alpha, beta, gamma, scale, degrees, dims, Lamb, a, c, family, offset, out):
+    samples, outputs = out.shape
+    for p in range(samples):
+        for r in range(outputs):
+            total = 0.
+            q = 0  # row of Lamb
+            s = 0  # component of X
+            for j in range(dims.shape[0]):
+                acc = 0.
+                for t in range(dims[j]):
+                    psi = 0.
+                    prev = 0.
+                    cur = 1.
+                    for d in range(degrees[s]):
+                        if d > 0:
+                            nxt = (alpha[d - 1] * X[p, s] + beta[d - 1]) * cur - gamma[d - 1] * prev
+                            prev = cur
+                            cur = nxt
+                        psi += _transform(cur * scale[d], family, offset) * Lamb[q + d, r]
+                    acc += _transform(np.exp(psi) - 1, family, offset) * a[s, r]
+                    q += degrees[s]
+                    s += 1
+                total += _transform(np.exp(acc) - 1, family, offset) * c[j, r]
+            out[p, r] = np.exp(total) - 1
+
+
+def design_matrix(poly_type, blocks, counts):
+    """
+    Same as basis_generator.design_matrix, one pass over samples for all degrees
+    :param poly_type: key of RECURRENCES
+    :param blocks: list of (n, m_i) arrays, i.e. [X1, X2, X3]
+    :param counts: list of polynomial numbers for each block (degree + 1)
+    :return: matrix with columns ordered by block, component and degree
+    """
+    blocks = [np.asarray(block) for block in blocks]
+    n = blocks[0].shape[0]
+    out = np.empty((n, sum(block.shape[1] * counts[i] for i, block in enumerate(blocks))),
+                   dtype=np.result_type(np.float32, *blocks))
+    shift = 0
+    for i, block in enumerate(blocks):
+        m = block.shape[1]
+        _fill_basis(block, *coefficients(poly_type, counts[i]),
+                    out=out[:, shift:shift + m * counts[i]].reshape(n, m, counts[i]))
+        shift += m * counts[i]
+    return out
+
+
+def segment_dot(M, W, lengths):
+    """
+    Sums of products M[r][:, q]*W[q, r] over consecutive segments of columns q, for every r
+    :param M: ndarray (outputs, n, columns), or (1, n, columns) shared by all outputs
+    :param W: ndarray (columns, outputs)
+    :param lengths: lengths of segments, sum(lengths) = columns
+    :return: ndarray (outputs, n, len(lengths))
+    """
+    M = np.ascontiguousarray(M)
+    W = np.ascontiguousarray(W, dtype=M.dtype)
+    out = np.empty((W.shape[1], M.shape[1], len(lengths)), dtype=M.dtype)
+    _segment_dot(M, W, np.asarray(lengths, dtype=np.int64), out)
+    return out
+
+
+def evaluate(poly_type, X, degrees, dims, Lamb, a, c, family, offset):
+    """
+    Model in normalized points without intermediate arrays
+    :param X: ndarray (samples, mX) of normalized points
+    :param degrees: number of polynomials for every component of X
+    :param dims: dimensions of X1, X2, X3
+    :param family: LOG, TANH or ARCTAN
+    :return: ndarray (samples, outputs) of normalized values
+    """
+    X = np.ascontiguousarray(np.atleast_2d(X), dtype=float)
+    degrees = np.asarray(degrees, dtype=np.int64)
+    out = np.empty((X.shape[0], np.shape(c)[1]), dtype=float)
+    _evaluate(X, *coefficients(poly_type, int(degrees.max())), degrees, np.asarray(dims, dtype=np.int64),
+              np.ascontiguousarray(Lamb, dtype=float), np.ascontiguousarray(a, dtype=float),
+              np.ascontiguousarray(c, dtype=float), family, offset, out)
+    return out
+
+
+def warm_up(background=False):
+    """
+    Compiles (or loads from cache) every kernel for float64 and float32 on tiny arrays,
+    so the first fit does not wait for compilation
+    :param background: run in daemon thread
+    :return: thread if background, otherwise None
+    """
+    if not ENABLED:
+        return None
+    if background:
+        thread = threading.Thread(target=warm_up, daemon=True)
+        thread.start()
+        return thread
+    x = np.full((2, 1), 0.5)
+    for poly_type in b_gen.RECURRENCES:
+        for dtype in (np.float64, np.float32):
+            design_matrix(poly_type, [x.astype(dtype)], [3])
+    for dtype in (np.float64, np.float32):
+        segment_dot(np.ones((1, 2, 2), dtype=dtype), np.ones((2, 1)), [2])
+    for family in (LOG, TANH, ARCTAN):
+        evaluate('cheb', np.full((1, 3), 0.5), [2, 2, 2], [1, 1, 1], np.ones((6, 1)), np.ones((3, 1)),
+                 np.ones((3, 1)), family, 1e-10)
+    return None
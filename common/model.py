@@ -0,0 +1,234 @@
+"""
+Fitted model without training data: ranges of normalization, degrees, transform and coefficients Lamb, a, c.
+Only numpy and basis_generator are imported, so a saved model is loaded in milliseconds by any process,
+e.g. model = Model.load('model.npz'); Y = model.calculate_values(X)
+CompiledModel collapses Model of log family into one product of powers of polynomials.
+"""
+import numpy as np
+
+import common.basis_generator as b_gen
+
+# transforms of aggregate functions by family, see Solve.aggregate
+TRANSFORMS = {
+    'log': lambda values, offset: np.log(1 + values + offset),
+    'tanh': lambda values, offset: np.tanh(values),
+    'arctan': lambda values, offset: 2 / np.pi * np.arctan(values),
+}
+# derivatives of transforms by values
+DERIVATIVES = {
+    'log': lambda values, offset: 1 / (1 + values + offset),
+    'tanh': lambda values, offset: 1 - np.tanh(values) ** 2,
+    'arctan': lambda values, offset: 2 / np.pi / (1 + values ** 2),
+}
+FAMILIES = ('log', 'tanh', 'arctan')  # by value of Solve.FAMILY
+
+
+def normalize_points(X, minX, maxX, clamp=False, fill_nan=False):
+    """
+    :param X: ndarray (m, mX) of points in original scale
+    :param clamp: negative normalized components are set to 1e-15
+    :param fill_nan: missing (NaN) components are set to 1
+    :return: points scaled as X of the model
+    """
+    X = (X - minX) / (maxX - minX)
+    if clamp:
+        X[X < 0] = 0.000000000000001
+    if fill_nan:
+        X[np.isnan(X)] = 1
+    return X
+
+
+class Model(object):
+    """
+    :param poly_type: key of basis_generator.RECURRENCES
+    :param family: key of TRANSFORMS
+    :param deg: numbers of polynomials for X1, X2, X3
+    :param dim: dimensions of X1, X2, X3 and Y
+    :param minX, maxX, minY, maxY: ranges of components of X and Y in training data
+    :param Lamb, a, c: coefficients of the model
+    :param offset: Solve.OFFSET
+    :param clamp, fill_nan: handling of points, see normalize_points
+    """
+    FIELDS = ('poly_type', 'family', 'deg', 'dim', 'minX', 'maxX', 'minY', 'maxY', 'Lamb', 'a', 'c', 'offset',
+              'clamp', 'fill_nan')
+
+    def __init__(self, poly_type, family, deg, dim, minX, maxX, minY, maxY, Lamb, a, c, offset=1e-10,
+                 clamp=False, fill_nan=False):
+        if poly_type not in b_gen.RECURRENCES:
+            raise ValueError('Polynomials %s can not be saved, use one of %s' % (poly_type, list(b_gen.RECURRENCES)))
+        self.poly_type = str(poly_type)
+        self.family = str(family)
+        self.deg = [int(d) for d in deg]
+        self.dim = [int(d) for d in dim]
+        self.minX, self.maxX = np.asarray(minX, dtype=float), np.asarray(maxX, dtype=float)
+        self.minY, self.maxY = np.asarray(minY, dtype=float), np.asarray(maxY, dtype=float)
+        self.Lamb = np.asarray(Lamb, dtype=float)
+        self.a = np.asarray(a, dtype=float)
+        self.c = np.asarray(c, dtype=float)
+        self.offset = float(offset)
+        self.clamp = bool(clamp)
+        self.fill_nan = bool(fill_nan)
+
+    @classmethod
+    def from_solver(cls, solver):
+        """
+        :param solver: fitted Solve or its subclass, stages it needs are computed if missing
+        :return: Model
+        """
+        return cls(solver.poly_type, FAMILIES[solver.FAMILY], solver.deg, solver.dim, solver.minX, solver.maxX,
+                   solver.minY, solver.maxY, solver.Lamb, solver.a, solver.c, solver.OFFSET,
+                   solver.CLAMP_POINTS, solver.FILL_NAN_POINTS)
+
+    def save(self, filename):
+        """
+        :param filename: .npz file, uncompressed so it is read without decompression
+        """
+        np.savez(filename, **{name: np.asarray(getattr(self, name)) for name in self.FIELDS})
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(**{name: f[name][()] if f[name].ndim == 0 else f[name] for name in cls.FIELDS})
+
+    def calculate_values(self, X):
+        """
+        Same as Solve.calculate_values
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: ndarray (m, outputs) of values in original scale
+        """
+        X = normalize_points(np.array(X, dtype=float, ndmin=2), self.minX, self.maxX, self.clamp, self.fill_nan)
+        transform = TRANSFORMS[self.family]
+        m = X.shape[0]
+        psi = np.empty((m, X.shape[1], self.c.shape[1]))
+        shift = 0
+        s = 0  # component of X
+        for i in range(3):
+            for j in range(self.dim[i]):
+                phi = b_gen.eval_basis(self.poly_type, X[:, s], self.deg[i])
+                psi[:, s] = np.exp(transform(phi, self.offset).dot(self.Lamb[shift:shift + self.deg[i]])) - 1
+                shift += self.deg[i]
+                s += 1
+        psi = transform(psi, self.offset)
+        big_phi = np.empty((m, 3, self.c.shape[1]))
+        bounds = np.cumsum([0] + self.dim[:3])
+        for i in range(3):
+            block = slice(bounds[i], bounds[i + 1])
+            big_phi[:, i] = np.exp(np.einsum('msr,sr->mr', psi[:, block], self.a[block])) - 1
+        Y = np.exp(np.einsum('mjr,jr->mr', transform(big_phi, self.offset), self.c)) - 1
+        return Y * (self.maxY - self.minY) + self.minY
+
+    def calculate_value(self, X):
+        return self.calculate_values([X])[0]
+
+    def calculate_jacobians(self, X):
+        """
+        Derivatives of calculate_values by components of points, by chain rule through aggregates of all levels:
+        dY_i/dx_s = (maxY_i - minY_i) * exp(sum of c*T(Phi)) * c_j * T'(Phi_j) * exp(sum of a*T(psi)) * a_s *
+        T'(psi_s) * exp(sum of Lamb*T(phi)) * sum of Lamb_n * T'(phi_n) * P'_n(x_s) / (maxX_s - minX_s),
+        where derivatives P'_n of basis come from its recurrence. Components that are clamped or filled
+        (see normalize_points) have zero derivatives.
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: ndarray (m, outputs, mX), [p, i, s] is derivative of Y_i by x_s in point p
+        """
+        X = np.array(X, dtype=float, ndmin=2)
+        scale = np.empty_like(X)
+        scale[:] = 1 / (self.maxX - self.minX)  # derivative of normalization
+        if self.clamp:
+            scale[X < self.minX] = 0
+        if self.fill_nan:
+            scale[np.isnan(X)] = 0
+        X = normalize_points(X, self.minX, self.maxX, self.clamp, self.fill_nan)
+        transform, derivative = TRANSFORMS[self.family], DERIVATIVES[self.family]
+        m = X.shape[0]
+        psi = np.empty((m, X.shape[1], self.c.shape[1]))
+        jacobian = np.empty_like(psi)  # derivatives of the current level by normalized components
+        bounds = np.cumsum([0] + self.dim[:3])
+        shift = 0
+        for i in range(3):  # components of a vector share degrees, so they are evaluated at once
+            block = slice(bounds[i], bounds[i + 1])
+            phi, phi_derivative = b_gen.eval_basis_derivatives(self.poly_type, X[:, block], self.deg[i])
+            width = self.dim[i] * self.deg[i]
+            lamb = self.Lamb[shift:shift + width].reshape(self.dim[i], self.deg[i], -1)
+            e = np.exp(np.einsum('msd,sdr->msr', transform(phi, self.offset), lamb))
+            psi[:, block] = e - 1
+            jacobian[:, block] = e * np.einsum('msd,sdr->msr', derivative(phi, self.offset) * phi_derivative, lamb)
+            shift += width
+        jacobian *= derivative(psi, self.offset)
+        psi = transform(psi, self.offset)
+        big_phi = np.empty((m, 3, self.c.shape[1]))
+        for i in range(3):
+            block = slice(bounds[i], bounds[i + 1])
+            e = np.exp(np.einsum('msr,sr->mr', psi[:, block], self.a[block]))
+            big_phi[:, i] = e - 1
+            jacobian[:, block] *= self.a[block] * (e * derivative(big_phi[:, i], self.offset) * self.c[i])[:, None]
+        e = np.exp(np.einsum('mjr,jr->mr', transform(big_phi, self.offset), self.c))
+        jacobian *= (e * (self.maxY - self.minY))[:, None]
+        jacobian *= scale[:, :, None]
+        return jacobian.transpose(0, 2, 1)
+
+
+class CompiledModel(object):
+    """
+    Model of log family in closed form, as PolynomialBuilder prints it in standard basis:
+    1 + F_i = prod of (1 + P_n(x_s)) ^ (c_ij * a_si * Lamb_sn,i) over components x_s of X_j and degrees n,
+    so every output is exp of one weighted sum of log(1 + P_n(x_s)), where polynomials 1 + P_n are evaluated
+    by Horner scheme from coefficients in standard basis. Basis recurrences and the three levels of aggregates
+    are not evaluated; OFFSET of aggregates is dropped, so values differ from Model by about OFFSET.
+    Tanh and arctan families do not collapse into products, for them ValueError is raised.
+    Polynomials are kept in normalized points (in [0, 1] on training data), where Horner scheme is well
+    conditioned, normalization is one multiply-add per point.
+    :param model: Model
+    """
+
+    def __init__(self, model):
+        if model.family != 'log':
+            raise ValueError('Only models of log family are products of polynomials, %s is not' % model.family)
+        self.minX, self.maxX = model.minX, model.maxX
+        self.clamp, self.fill_nan = model.clamp, model.fill_nan
+        basis = b_gen.basis_coefficients(model.poly_type, max(model.deg))
+        basis[:, 0] += 1 + model.offset  # 1 + P_n + OFFSET, as in the innermost aggregate
+        # rows of Lamb are ordered by vector, component and degree; component and weight of every row
+        components, degrees, weights = [], [], []
+        shift = 0
+        s = 0  # component of X
+        for i in range(3):
+            for j in range(model.dim[i]):
+                components += [s] * model.deg[i]
+                degrees += range(model.deg[i])
+                weights.append(model.Lamb[shift:shift + model.deg[i]] * model.a[s] * model.c[i])
+                shift += model.deg[i]
+                s += 1
+        weights = np.vstack(weights)
+        degrees = np.array(degrees)
+        constant = degrees == 0  # 1 + P_0 = 2 does not depend on points
+        scale = model.maxY - model.minY
+        # Y = scale * (exp(bias + sum of w * log(1 + P_n(x_s))) - 1) + minY
+        with np.errstate(divide='ignore'):
+            self.bias = weights[constant].sum(axis=0) * np.log(basis[0, 0]) + np.log(scale)
+        self.shift = model.minY - scale
+        self.components = np.array(components)[~constant]
+        self.weights = weights[~constant]
+        # coefficients by power, highest first, for columns of weights
+        self.coefficients = basis[degrees[~constant]].T[::-1].copy()
+
+    @classmethod
+    def from_solver(cls, solver):
+        return cls(Model.from_solver(solver))
+
+    def calculate_values(self, X):
+        """
+        Same as Model.calculate_values
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: ndarray (m, outputs) of values in original scale
+        """
+        X = normalize_points(np.array(X, dtype=float, ndmin=2), self.minX, self.maxX, self.clamp, self.fill_nan)
+        X = X[:, self.components]
+        values = np.empty_like(X)
+        values[:] = self.coefficients[0]
+        for coefficients in self.coefficients[1:]:
+            values *= X
+            values += coefficients
+        return np.exp(np.log(values).dot(self.weights) + self.bias) + self.shift
+
+    def calculate_value(self, X):
+        return self.calculate_values([X])[0]
@@ -0,0 +1,221 @@
+"""
+Local HTTP service for fitted models saved by Solve.save_model, so other tools get predictions without
+importing Solve and fitting. Rows of concurrent requests to one model are joined into one batch.
+Usage: python -m common.server risk=model.npz --port 8765
+       POST /predict/risk with {"X": [[...], ...]} or {"X": [...]} returns {"Y": ..., "latency_ms": ..., "batch": ...},
+       values that are NaN or infinite are null in Y
+       GET /models lists models, GET /stats shows batches and latencies
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from common.model import Model, CompiledModel
+
+
+class _Request(object):
+    def __init__(self, X):
+        self.X = X
+        self.arrived = time.perf_counter()
+        self.done = threading.Event()
+        self.values = None
+        self.error = None
+        self.batch = 0  # rows in batch the request was evaluated with
+
+
+class MicroBatcher(object):
+    """
+    Evaluates model in its own thread, rows of requests that came while the first one waits are evaluated
+    in the same call of calculate_values
+    :param model: Model or CompiledModel
+    :param window: seconds the first request of a batch waits for others
+    :param max_rows: batch is evaluated without waiting when it has this many rows
+    :param history: number of last latencies kept for stats
+    """
+
+    def __init__(self, model, window=0.002, max_rows=4096, history=10000):
+        self.model = model
+        self.window = window
+        self.max_rows = max_rows
+        self.inputs = len(model.minX)
+        self.outputs = len(model.calculate_value((model.minX + model.maxX) / 2))  # also warms caches up
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.latencies = deque(maxlen=history)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def predict(self, X):
+        """
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: (values (m, outputs), latency in seconds, rows in batch)
+        """
+        X = np.array(X, dtype=float, ndmin=2)
+        if X.ndim != 2 or X.shape[1] != self.inputs:
+            raise ValueError('Expected points with %d components, got shape %s' % (self.inputs, X.shape))
+        request = _Request(X)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.values, time.perf_counter() - request.arrived, request.batch
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            rows = len(batch[0].X)
+            deadline = batch[0].arrived + self.window
+            while rows < self.max_rows:
+                try:
+                    request = self.queue.get(timeout=max(0., deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                rows += len(request.X)
+            self._evaluate(batch, rows)
+
+    def _evaluate(self, batch, rows):
+        try:
+            values = self.model.calculate_values(np.vstack([request.X for request in batch]))
+            parts = np.split(values, np.cumsum([len(request.X) for request in batch[:-1]]))
+        except Exception as error:
+            parts = [None] * len(batch)
+            for request in batch:
+                request.error = error
+        now = time.perf_counter()
+        self.batches += 1
+        self.requests += len(batch)
+        self.rows += rows
+        for request, part in zip(batch, parts):
+            request.values = part
+            request.batch = rows
+            self.latencies.append(now - request.arrived)
+            request.done.set()
+
+    def stats(self):
+        """
+        :return: dict of numbers of requests, batches and rows, and percentiles of latency in milliseconds
+        """
+        latencies = np.array(self.latencies) * 1e3
+        result = {'requests': self.requests, 'batches': self.batches, 'rows': self.rows,
+                  'rows_per_batch': self.rows / self.batches if self.batches else 0.}
+        for q in (50, 90, 99):
+            result['latency_ms_p%d' % q] = float(np.percentile(latencies, q)) if len(latencies) else None
+        return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/models':
+            self._reply(200, {name: {'inputs': batcher.inputs, 'outputs': batcher.outputs,
+                                     'compiled': isinstance(batcher.model, CompiledModel)}
+                              for name, batcher in self.server.models.items()})
+        elif self.path == '/stats':
+            self._reply(200, {name: batcher.stats() for name, batcher in self.server.models.items()})
+        else:
+            self._reply(404, {'error': 'Unknown path %s' % self.path})
+
+    def do_POST(self):
+        name = self.path[len('/predict/'):] if self.path.startswith('/predict/') else None
+        if name not in self.server.models:
+            self._reply(404, {'error': 'Unknown model %s' % name})
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+            single = np.ndim(data['X']) == 1
+            values, latency, batch = self.server.models[name].predict(data['X'])
+        except KeyError:
+            self._reply(400, {'error': 'Request has no X'})
+            return
+        except (ValueError, TypeError) as error:
+            self._reply(400, {'error': str(error)})
+            return
+        except Exception as error:
+            self._reply(500, {'error': '%s: %s' % (type(error).__name__, error)})
+            return
+        values = np.where(np.isfinite(values), values, None)  # NaN and infinity are not JSON, they are sent as null
+        self._reply(200, {'Y': (values[0] if single else values).tolist(), 'latency_ms': latency * 1e3,
+                          'batch': batch})
+
+    def _reply(self, code, content):
+        body = json.dumps(content, allow_nan=False).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(_Handler, self).log_message(format, *args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # connections of concurrent clients waiting for accept
+
+
+def load(filename, compiled=False):
+    """
+    :param filename: .npz file of Solve.save_model
+    :param compiled: use CompiledModel when model collapses into polynomials (log family)
+    :return: Model or CompiledModel
+    """
+    model = Model.load(filename)
+    if compiled and model.family == 'log':
+        return CompiledModel(model)
+    return model
+
+
+def make_server(models, host='127.0.0.1', port=8765, window=0.002, max_rows=4096, verbose=False):
+    """
+    :param models: dict name -> Model or CompiledModel
+    :return: ThreadingHTTPServer, serve_forever() starts it
+    """
+    server = _Server((host, port), _Handler)
+    server.models = {name: MicroBatcher(model, window, max_rows) for name, model in models.items()}
+    server.verbose = verbose
+    return server
+
+
+def predict(url, name, X, timeout=10.):
+    """
+    Client of the service
+    :param url: address of the service, e.g. 'http://127.0.0.1:8765'
+    :param name: name of model
+    :param X: one point or list of points
+    :return: dict with Y, latency_ms and batch
+    """
+    X = np.asarray(X, dtype=float).tolist()
+    request = Request('%s/predict/%s' % (url, name), json.dumps({'X': X}).encode(),
+                      {'Content-Type': 'application/json'})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HTTP service of fitted models')
+    parser.add_argument('models', nargs='+', metavar='NAME=FILE', help='models saved by Solve.save_model')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=2., help='milliseconds a batch waits for requests')
+    parser.add_argument('--max-rows', type=int, default=4096)
+    parser.add_argument('--compiled', action='store_true', help='evaluate log family models in closed form')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    models = {}
+    for item in args.models:
+        name, _, filename = item.partition('=')
+        models[name] = load(filename or name, args.compiled)
+    server = make_server(models, args.host, args.port, args.window / 1e3, args.max_rows, args.verbose)
+    print('Serving %s on http://%s:%d' % (', '.join(models), args.host, args.port))
+    server.serve_forever()
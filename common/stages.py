@@ -0,0 +1,100 @@
+"""
+Dependency tracking of stages of a method: outputs of stages are computed lazily and dropped when a parameter
+or an upstream output they are computed from is assigned
+"""
+
+
+class Stages(object):
+    """
+    Mixin of Solve of every lab, which describes its method with tables:
+    STAGES - (method, attributes it builds, stages it depends on), in order of computation
+    PARAMS - parameter -> first stage that has to be recomputed when it is assigned
+    CACHES - private cache -> stages it is built from, it is dropped with outputs of any of them
+    INPUT_STAGES - stages whose outputs are data of the model, they are passed by inputs()
+    """
+    STAGES = ()
+    PARAMS = {}
+    CACHES = {}
+    INPUT_STAGES = ()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self.PARAMS:
+            self.invalidate(self.PARAMS[name])
+        else:
+            stage = self._stage_of(name)
+            if stage is not None:
+                self.invalidate(stage, itself=False)
+
+    def __getattr__(self, name):
+        """
+        Outputs of stages are lazy: reading missing output runs its stage and the missing stages it depends on
+        """
+        stage = self._stage_of(name)
+        if stage is None:
+            raise AttributeError(name)
+        self.compute(stage)
+        if name not in self.__dict__:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
+    def _stage_of(self, name):
+        """
+        :param name: name of attribute
+        :return: name of stage that builds attribute or None
+        """
+        if not name.startswith('_'):
+            for stage, outputs, _ in self.STAGES:
+                if name in outputs:
+                    return stage
+        return None
+
+    @classmethod
+    def stages_with(cls, **outputs):
+        """
+        Stages of subclass that builds other attributes in some stages
+        :param outputs: stage -> tuple of attributes it builds
+        :return: copy of STAGES with replaced outputs
+        """
+        return tuple((stage, outputs.get(stage, built), depends) for stage, built, depends in cls.STAGES)
+
+    def invalidate(self, stage, itself=True):
+        """
+        Drops outputs of stage and of all stages that depend on it, they are recomputed on next access
+        :param stage: name of stage
+        :param itself: drop outputs of stage itself too
+        """
+        dirty = {stage}
+        for name, _, depends in self.STAGES:
+            if dirty.intersection(depends):
+                dirty.add(name)
+        if not itself:
+            dirty.discard(stage)
+        for name, outputs, _ in self.STAGES:
+            if name in dirty:
+                for attr in outputs:
+                    self.__dict__.pop(attr, None)
+        for cache, stages in self.CACHES.items():
+            if dirty.intersection(stages):
+                self.__dict__.pop(cache, None)
+
+    def inputs(self):
+        """
+        Parameters and data of the model without anything computed from them, enough to rebuild it in other process
+        :return: dict of attributes, restore with obj = cls.__new__(cls); obj.__dict__.update(inputs)
+        """
+        return {name: value for name, value in self.__dict__.items()
+                if not name.startswith('_') and self._stage_of(name) in (None,) + tuple(self.INPUT_STAGES)}
+
+    def compute(self, last=None):
+        """
+        Runs stages whose outputs are missing or outdated, upstream stages first
+        :param last: stage to compute with everything it depends on, by default all stages
+        """
+        needed = {last}
+        for stage, _, depends in reversed(self.STAGES):
+            if stage in needed:
+                needed.update(depends)
+        for stage, outputs, _ in self.STAGES:
+            if (last is None or stage in needed) and any(attr not in self.__dict__ for attr in outputs):
+                getattr(self, stage)()
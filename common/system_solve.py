@@ -0,0 +1,398 @@
+__author__ = 'strike'
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+from scipy import linalg
+from scipy.linalg import lapack
+from scipy.sparse.linalg import lsqr
+
+SOLVERS = dict()  # name -> least squares backend class
+ALIASES = {'lsq': 'svd', 'cjg': 'cg', 'cjg2': 'cg', 'cjg3': 'cg'}  # former names of methods
+
+# condition number is estimated through A.T*A, so values above ~1e7 (square root of machine epsilon) are not seen
+CHOLESKY_COND = 1e4  # normal equations square condition number, so they are used only for well conditioned A
+QR_COND = 1e6
+# float32 factors are followed by refinement in float64, that converges only while cond*eps(float32) is small
+SINGLE_CHOLESKY_COND = 1e2
+SINGLE_QR_COND = 1e3
+ITERATIVE_COLUMNS = 1000  # above this number of columns factorizations are replaced with LSQR
+REFINE_STEPS = 10  # maximum of steps of iterative refinement
+RIDGE = 1e-12  # shift of diagonal of Gram matrix of a subset in NestedLeastSquares, relative to its largest element
+
+
+def as_floating(A):
+    '''
+    :param A: matrix or array
+    :return: ndarray of float32 if A is float32, of float64 otherwise
+    '''
+    A = np.asarray(A)
+    return A.astype(np.result_type(A, np.float32), copy=False)
+
+
+def register_solver(name):
+    '''
+    Decorator that adds least squares backend to SOLVERS
+    :param name: name of backend for least_squares(method=...)
+    :return: class decorator
+    '''
+    def decorator(cls):
+        cls.name = name
+        SOLVERS[name] = cls
+        return cls
+    return decorator
+
+
+class LeastSquaresSolver(object, metaclass=ABCMeta):
+    '''
+    Base class for backends. Matrix A is factored once in constructor, then solve(B) finds X with |AX - B| -> min
+    for every column of B. Factors are computed in precision of A (float32 or float64).
+    :param A: matrix A
+    :param tol: tolerance (relative cutoff for direct backends, relative residual for iterative ones)
+    :param max_iter: maximum of iterations (direct backends make one pass)
+    '''
+    name = None
+    default_tol = 1e-12
+
+    def __init__(self, A, tol=None, max_iter=None):
+        self.A = as_floating(A)
+        self.tol = self.default_tol if tol is None else tol
+        self.max_iter = 10 * self.A.shape[1] if max_iter is None else max_iter
+        self.iterations = 0
+
+    @abstractmethod
+    def solve(self, B):
+        '''
+        :param B: vector b or matrix with right-hand sides in columns
+        :return: ndarray X with solution in every column
+        '''
+
+    def _rhs(self, B):
+        return np.asarray(B, dtype=self.A.dtype).reshape(self.A.shape[0], -1)
+
+    def solve_refined(self, B, tol, max_steps=REFINE_STEPS):
+        '''
+        Mixed precision iterative refinement: residual B - AX is computed in float64 and the correction is solved
+        with factors of A, until correction is below tol relative to X
+        :param B: vector b or matrix with right-hand sides in columns
+        :param tol: relative tolerance of refinement
+        :param max_steps: maximum of refinement steps
+        :return: float64 ndarray X with solution in every column
+        '''
+        B = np.asarray(B, dtype=float).reshape(self.A.shape[0], -1)
+        X = self.solve(B).astype(float)
+        self.refinements = 0
+        while self.refinements < max_steps:
+            self.refinements += 1
+            dX = self.solve(B - self.A.dot(X))
+            X += dX
+            if np.linalg.norm(dX) <= tol * np.linalg.norm(X):
+                break
+        return X
+
+
+@register_solver('cholesky')
+class CholeskySolver(LeastSquaresSolver):
+    '''
+    Cholesky factorization of normal equations A.T*A x = A.T*b. Fastest, for well conditioned A only.
+    '''
+
+    def __init__(self, A, tol=None, max_iter=None, factor=None):
+        super(CholeskySolver, self).__init__(A, tol, max_iter)
+        self.factor = factor if factor is not None else linalg.cholesky(self.A.T.dot(self.A))
+        self.iterations = 1
+
+    def solve(self, B):
+        return linalg.cho_solve((self.factor, False), self.A.T.dot(self._rhs(B)))
+
+
+@register_solver('qr')
+class QRSolver(LeastSquaresSolver):
+    '''
+    Reduced QR factorization of A, for moderately ill conditioned full rank A.
+    '''
+
+    def __init__(self, A, tol=None, max_iter=None):
+        super(QRSolver, self).__init__(A, tol, max_iter)
+        self.Q, self.R = np.linalg.qr(self.A)
+        self.iterations = 1
+
+    def solve(self, B):
+        return linalg.solve_triangular(self.R, self.Q.T.dot(self._rhs(B)))
+
+
+@register_solver('svd')
+class SVDSolver(LeastSquaresSolver):
+    '''
+    Singular value decomposition of A. Singular values below tol*max are cut off,
+    so rank deficient A gets minimum norm solution.
+    '''
+
+    def __init__(self, A, tol=None, max_iter=None):
+        super(SVDSolver, self).__init__(A, tol, max_iter)
+        self.U, s, self.Vt = np.linalg.svd(self.A, full_matrices=False)
+        self.s_inv = np.zeros_like(s)
+        if len(s):
+            keep = s > max(self.tol, max(self.A.shape) * np.finfo(self.A.dtype).eps) * s[0]
+            self.s_inv[keep] = 1 / s[keep]
+        self.iterations = 1
+
+    def solve(self, B):
+        return self.Vt.T.dot(self.s_inv[:, None] * self.U.T.dot(self._rhs(B)))
+
+
+@register_solver('lsqr')
+class LSQRSolver(LeastSquaresSolver):
+    '''
+    Iterative LSQR method, works with products by A and A.T only.
+    '''
+    default_tol = 1e-10
+
+    def solve(self, B):
+        B = self._rhs(B)
+        X = np.zeros((self.A.shape[1], B.shape[1]), dtype=self.A.dtype)
+        self.iterations = 0
+        for i in range(B.shape[1]):
+            result = lsqr(self.A, B[:, i], atol=self.tol, btol=self.tol, iter_lim=self.max_iter)
+            X[:, i] = result[0]
+            self.iterations = max(self.iterations, result[2])
+        return X
+
+
+@register_solver('cg')
+class CGSolver(LeastSquaresSolver):
+    '''
+    Conjugate gradient method for normal equations (CGLS) with Jacobi preconditioner.
+    A.T*A is never formed, all columns of B are iterated together.
+    '''
+    default_tol = 1e-10
+
+    def __init__(self, A, tol=None, max_iter=None):
+        super(CGSolver, self).__init__(A, tol, max_iter)
+        norms = np.linalg.norm(self.A, axis=0)
+        # Jacobi preconditioner of A.T*A is equal to scaling of columns of A
+        self.scale = np.zeros_like(norms)
+        self.scale[norms > 0] = 1 / norms[norms > 0]
+        self.AD = self.A * self.scale
+
+    def solve(self, B):
+        R = self._rhs(B).copy()
+        Y = np.zeros((self.AD.shape[1], R.shape[1]), dtype=self.A.dtype)
+        S = self.AD.T.dot(R)
+        P = S.copy()
+        gamma = np.sum(S * S, axis=0)
+        stop = self.tol ** 2 * gamma
+        self.iterations = 0
+        while self.iterations < self.max_iter and np.any(gamma > stop):
+            self.iterations += 1
+            Q = self.AD.dot(P)
+            qq = np.sum(Q * Q, axis=0)
+            active = (gamma > stop) & (qq > 0)
+            alpha = np.where(active, gamma / np.where(active, qq, 1), 0)
+            Y += alpha * P
+            R -= alpha * Q
+            S = self.AD.T.dot(R)
+            gamma_next = np.sum(S * S, axis=0)
+            P = S + np.where(active, gamma_next / np.where(active, gamma, 1), 0) * P
+            gamma = np.where(active, gamma_next, 0)
+        return self.scale[:, None] * Y
+
+
+@register_solver('cg_normal')
+class NormalCGSolver(LeastSquaresSolver):
+    '''
+    Conjugate gradient method for normal equations A.T*A x = A.T*b without preconditioner, the method lab_2 used
+    before backends were added. Iterations of a column stop when 2-norm of its residual of normal equations
+    is below tol (absolute) or after max_iter + 1 iterations, as in the former loop.
+    On rank deficient A the iterations do not converge and stop at max_iter, where the result follows rounding
+    of A and of products by it, so it does not reproduce former solutions of such A, only the method.
+    '''
+    default_tol = 1e-6
+
+    def __init__(self, A, tol=None, max_iter=None):
+        super(NormalCGSolver, self).__init__(A, tol, max_iter)
+        self.G = self.A.T.dot(self.A)
+
+    def solve(self, B):
+        R = self.A.T.dot(self._rhs(B))
+        X = np.zeros_like(R)
+        V = R.copy()
+        active = np.ones(R.shape[1], dtype=bool)
+        self.iterations = 0
+        while np.any(active):
+            self.iterations += 1
+            GV = self.G.dot(V)
+            curvature = np.sum(V * GV, axis=0)
+            active &= curvature > 0
+            curvature = np.where(active, curvature, 1)
+            alpha = np.where(active, np.sum(V * R, axis=0) / curvature, 0)
+            X += alpha * V
+            R -= alpha * GV
+            beta = -np.sum(GV * R, axis=0) / curvature
+            V = R + beta * V
+            active &= (np.linalg.norm(R, axis=0) >= self.tol) & (self.iterations <= self.max_iter)
+        return X
+
+
+class NestedLeastSquares(object):
+    '''
+    Least squares |A[:, columns]x - B| -> min for many subsets of columns of one matrix A, i.e. for nested bases.
+    Gram matrix A.T*A and A.T*B are computed once. Cholesky factor of the last subset is kept, and a subset that
+    shares a prefix with it reuses the factor of the prefix and borders it with new columns only.
+    Small ridge on the diagonal makes singular subsets solvable, so the result approximates minimum norm solution.
+    Ridge is relative to the largest diagonal element of the subset, so columns G has besides the subset
+    (higher degrees of a nested basis) do not change its solution; a subset with other ridge is factored anew.
+    :param G: Gram matrix A.T*A of all columns
+    :param AtB: A.T*B
+    :param ridge: shift of diagonal relative to the largest diagonal element of the subset
+    '''
+
+    def __init__(self, G, AtB, ridge=RIDGE):
+        self.G = G
+        self.AtB = AtB
+        self.ridge = ridge
+        self.shift = 0  # shift of diagonal in factor
+        self.columns = []
+        self.factor = np.zeros((0, 0))
+        self.bordered = 0  # number of columns added to factors, for statistics
+
+    @classmethod
+    def from_matrix(cls, A, B, ridge=RIDGE):
+        '''
+        :param A: matrix with all columns, Gram matrix is computed in float64 whatever precision of A is
+        :param B: vector b or matrix with right-hand sides in columns
+        '''
+        A = np.asarray(A, dtype=float)
+        return cls(A.T.dot(A), A.T.dot(np.asarray(B, dtype=float).reshape(A.shape[0], -1)), ridge)
+
+    def factorize(self, columns):
+        '''
+        Upper Cholesky factor of G[columns, columns] + shift*I
+        :param columns: list of indices of columns
+        :return: factor R
+        '''
+        columns = list(columns)
+        shift = self.ridge * self.G.diagonal()[columns].max() if columns else 0
+        keep = 0
+        while (shift == self.shift and keep < min(len(columns), len(self.columns))
+               and columns[keep] == self.columns[keep]):
+            keep += 1
+        R = self.factor[:keep, :keep]  # factor of leading block is leading block of factor
+        new = columns[keep:]
+        if new:
+            G_new = self.G[np.ix_(new, new)] + shift * np.eye(len(new))
+            if keep:
+                S = linalg.solve_triangular(R, self.G[np.ix_(columns[:keep], new)], trans='T')
+                R = np.block([[R, S], [np.zeros((len(new), keep)), linalg.cholesky(G_new - S.T.dot(S))]])
+            else:
+                R = linalg.cholesky(G_new)
+            self.bordered += len(new)
+        self.columns, self.factor, self.shift = columns, R, shift
+        return R
+
+    def solve(self, columns):
+        '''
+        :param columns: list of indices of columns of A
+        :return: ndarray X (len(columns), outputs), solution for A[:, columns]
+        '''
+        return linalg.cho_solve((self.factorize(columns), False), self.AtB[list(columns)])
+
+    def condition(self, columns):
+        '''
+        :param columns: list of indices of columns of A
+        :return: estimated condition number of A[:, columns], from its factor
+        '''
+        columns = list(columns)
+        return factor_condition(self.factorize(columns), self.G[np.ix_(columns, columns)])
+
+
+def condition_estimate(A):
+    '''
+    Cheap estimation of condition number of A from Cholesky factor of A.T*A (LAPACK pocon)
+    :param A: matrix A
+    :return: tuple (estimated condition number of A, Cholesky factor or None if A.T*A is not positive definite)
+    '''
+    A = as_floating(A)
+    G = A.T.dot(A)
+    try:
+        factor = linalg.cholesky(G)
+    except np.linalg.LinAlgError:
+        return np.inf, None
+    return factor_condition(factor, G), factor
+
+
+def factor_condition(factor, G):
+    '''
+    :param factor: upper Cholesky factor of G
+    :param G: Gram matrix A.T*A
+    :return: estimated condition number of A
+    '''
+    pocon, = lapack.get_lapack_funcs(('pocon',), (factor,))
+    rcond, info = pocon(factor, np.abs(G).sum(axis=0).max())
+    if info != 0 or rcond <= 0:
+        return np.inf
+    return np.sqrt(1 / rcond)
+
+
+def factorize(A, method='auto', tol=None, max_iter=None, fallback='svd'):
+    '''
+    Factors matrix A with given backend or chooses backend by condition number of A
+    :param A: matrix A
+    :param method: name from SOLVERS, one of ALIASES or 'auto'
+    :param tol: tolerance of backend
+    :param max_iter: maximum of iterations of backend
+    :param fallback: name of backend 'auto' chooses for A too ill conditioned for QR
+    :return: backend object, use its solve(B)
+    '''
+    method = ALIASES.get(method, method)
+    if method != 'auto':
+        return SOLVERS[method](A, tol, max_iter)
+    A = as_floating(A)
+    if A.shape[1] > ITERATIVE_COLUMNS:
+        return SOLVERS['lsqr'](A, tol, max_iter)
+    cond, factor = condition_estimate(A)
+    single = A.dtype == np.float32
+    if cond < (SINGLE_CHOLESKY_COND if single else CHOLESKY_COND):
+        return CholeskySolver(A, tol, max_iter, factor=factor)
+    elif cond < (SINGLE_QR_COND if single else QR_COND):
+        return SOLVERS['qr'](A, tol, max_iter)
+    return SOLVERS[fallback](A, tol, max_iter)
+
+
+def least_squares(A, B, method='auto', tol=None, max_iter=None, refine=None, fallback='svd'):
+    '''
+    Finds X such that |AX - B| -> min for every column of B
+    :param A: matrix A
+    :param B: vector b or matrix with right-hand sides in columns
+    :param method: name of backend (see factorize)
+    :param refine: relative tolerance of iterative refinement in float64, None to skip it
+    :param fallback: backend of 'auto' for ill conditioned A (see factorize)
+    :return: ndarray X with solution in every column
+    '''
+    solver = factorize(A, method, tol, max_iter, fallback)
+    if refine is None:
+        return solver.solve(B)
+    return solver.solve_refined(B, refine)
+
+
+def batched_least_squares(As, Bs, refine=None):
+    '''
+    Least squares |A[k]x - b[k]| -> min for a stack of systems of equal shape at once
+    :param As: ndarray of shape (k, n, m)
+    :param Bs: ndarray of shape (k, n)
+    :param refine: relative tolerance of iterative refinement in float64, None to skip it
+    :return: ndarray of shape (k, m) with minimum norm solutions
+    '''
+    As = as_floating(As)
+    # default cutoff of pinv is below resolution of float32
+    pinv = np.linalg.pinv(As, max(As.shape[1:]) * np.finfo(np.float32).eps if As.dtype == np.float32 else 1e-15)
+    X = np.einsum('kmn,kn->km', pinv, np.asarray(Bs, dtype=As.dtype))
+    if refine is None:
+        return X
+    Bs = np.asarray(Bs, dtype=float)
+    X = X.astype(float)
+    for step in range(REFINE_STEPS):
+        dX = np.einsum('kmn,kn->km', pinv, Bs - np.einsum('knm,km->kn', As, X))
+        X += dX
+        if np.linalg.norm(dX) <= refine * np.linalg.norm(X):
+            break
+    return X
@@ -1,3 +1,4 @@
+import numpy as np
 from numpy.polynomial import Polynomial as pm
 __author__ = 'vlad'
 
@@ -37,3 +38,87 @@ def basis_laguerre(degree):
         basis.append(pm([2*i + 1, -1])*basis[-1] - i * i * basis[-2])
     return basis
 
+
+# Three-term recurrences P[k+1](x) = (alpha*x + beta)*P[k](x) - gamma*P[k-1](x) with P[0] = 1,
+# given as function of k -> (alpha, beta, gamma); the optional second item rescales P[k] after evaluation
+RECURRENCES = {
+    'chebyshev': (lambda k: (2., -1., 0.) if k == 0 else (4., -2., 1.), None),
+    'legendre': (lambda k: (2. * (2 * k + 1) / (k + 1), -(2. * k + 1) / (k + 1), float(k) / (k + 1)), None),
+    'laguerre': (lambda k: (-1. / (k + 1), (2. * k + 1) / (k + 1), float(k) / (k + 1)), None),
+    'hermit': (lambda k: (2., 0., 2. * k), None),
+}
+
+
+def eval_basis(poly_type, x, count, out=None):
+    """
+    Evaluates polynomials of degrees 0..count-1 in all points of x at once
+    :param poly_type: key of RECURRENCES
+    :param x: ndarray of points of any shape
+    :param count: number of polynomials (max degree + 1)
+    :param out: optional ndarray of shape x.shape + (count,) to write result into
+    :return: ndarray of shape x.shape + (count,), out[..., k] = P[k](x), float32 for float32 x and float64 otherwise
+    """
+    recurrence, scale = RECURRENCES[poly_type]
+    x = np.asarray(x)
+    x = x.astype(np.result_type(x, np.float32), copy=False)  # float32 points stay in single precision
+    if out is None:
+        out = np.empty(x.shape + (count,), dtype=x.dtype)
+    if count == 0:
+        return out
+    out[..., 0] = 1
+    for k in range(count - 1):
+        alpha, beta, gamma = recurrence(k)
+        out[..., k + 1] = (alpha * x + beta) * out[..., k]
+        if k > 0 and gamma:
+            out[..., k + 1] -= gamma * out[..., k - 1]
+    if scale:
+        for k in range(count):
+            out[..., k] *= scale(k)
+    return out
+
+
+def basis_coefficients(poly_type, count):
+    """
+    Coefficients of polynomials of degrees 0..count-1 in standard basis, by the same recurrence as eval_basis
+    :param poly_type: key of RECURRENCES
+    :param count: number of polynomials (max degree + 1)
+    :return: ndarray (count, count), P[k](x) = sum of out[k, d] * x^d
+    """
+    recurrence, scale = RECURRENCES[poly_type]
+    out = np.zeros((count, count))
+    if count == 0:
+        return out
+    out[0, 0] = 1
+    for k in range(count - 1):
+        alpha, beta, gamma = recurrence(k)
+        out[k + 1, 1:] = alpha * out[k, :-1]
+        out[k + 1] += beta * out[k]
+        if k > 0 and gamma:
+            out[k + 1] -= gamma * out[k - 1]
+    if scale:
+        for k in range(count):
+            out[k] *= scale(k)
+    return out
+
+
+def design_matrix(poly_type, blocks, counts, out=None):
+    """
+    Builds matrix of basis values for vectors X1, X2, ... in one preallocated array
+    :param poly_type: key of RECURRENCES
+    :param blocks: list of (n, m_i) arrays, i.e. [X1, X2, X3]
+    :param counts: list of polynomial numbers for each block (degree + 1)
+    :param out: optional (n, sum(m_i*counts_i)) array to write result into
+    :return: matrix with columns ordered by block, component and degree, float32 if all blocks are float32
+    """
+    blocks = [np.asarray(block) for block in blocks]
+    n = blocks[0].shape[0]
+    width = sum(block.shape[1] * counts[i] for i, block in enumerate(blocks))
+    if out is None:
+        out = np.empty((n, width), dtype=np.result_type(np.float32, *blocks))
+    shift = 0
+    for i, block in enumerate(blocks):
+        m = block.shape[1]
+        # view on columns of the block, split by component and degree
+        eval_basis(poly_type, block, counts[i], out=out[:, shift:shift + m * counts[i]].reshape(n, m, counts[i]))
+        shift += m * counts[i]
+    return out
@@ -0,0 +1,18 @@
+__author__ = 'strike'
+# errors of fits on nested basis of choose_p must be the errors of plain fits of the same p
+from lab_2.solve import *
+
+MAX_P = [15, 15, 15]
+
+for poly_type in ['hermit', 'laguerre']:
+    for weights in ['average', 'scaled']:
+        for multiblock in [False, True]:
+            for degrees in [[4, 4, 4], [4, 2, 2], [9, 9, 9], [1, 1, 1], [14, 14, 14]]:
+                d = {'samples': 50, 'input_file': 'data_2.txt', 'dimensions': [3, 1, 2, 2], 'output_file': '',
+                     'degrees': degrees, 'lambda_multiblock': multiblock, 'weights': weights, 'poly_type': poly_type}
+                plain = np.ravel(Solve(d).norm_error)
+                a = Solve(d)
+                a.max_p = MAX_P
+                nested = np.ravel(a.norm_error)
+                print(poly_type, weights, multiblock, degrees, plain, nested)
+                assert np.allclose(plain, nested, rtol=0, atol=1e-6), 'nested fit differs from plain fit'
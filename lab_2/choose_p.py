@@ -1,35 +1,32 @@
 __author__ = 'strike'
 from lab_2.solve import *
+from common.degree_cache import DegreeCache, DEFAULT_PATH
 
 a= Solve({'samples':50, 'input_file': 'data_2.txt', 'dimensions': [3, 1, 2, 2], 'output_file': '', 'degrees': [3, 3, 3],
      'lambda_multiblock': False, 'weights': 'average', 'poly_type': 'hermit'})
 
 #a= Solve({'samples': 100, 'input_file': 'data_2_our_sample.txt', 'dimensions': [1, 2, 1, 1], 'output_file': '', 'degrees': [3, 3, 3],
 #     'lambda_multiblock': False, 'weights': 'average', 'poly_type': 'hermit'})
-a.define_data()
-a.norm_data()
-a.define_norm_vectors()
-a.built_B()
-a.poly_func()
-def test_p(a,p1,p2,p3):
+def test_p(a,p1,p2,p3,cache=DEFAULT_PATH):
     d = list()
     #d = dict()
-    for i in range(1,p1):
-        for j in range(1,p2):
-            for k in range(1,p3):
-                a.p = [i+1,j+1,k+1]
-                print(a.p)
-                a.built_A()
-                a.lamb()
-                a.psi()
-                a.built_a()
-                a.built_Fi()
-                a.built_c()
-                a.built_F()
-                a.built_F_()
-                #d[str(i)+' '+str(j)+' '+str(k)] = [np.linalg.norm(a.F - a.Y), np.std(a.F_ - a.Y_, axis=0),\
-                 #                   np.linalg.norm(a.F_ - a.Y_)]
-                d.append((str(i)+' '+str(j)+' '+str(k),np.linalg.norm(a.norm_error)))
+    a.max_p = [p1, p2, p3] # basis and Gram matrix are built once for the largest p and reused
+    with DegreeCache(cache) as store:
+        key = store.key(a) # errors of p fitted before on the same data and parameters are not computed again
+        known = store.load(key)
+        for i in range(1,p1):
+            for j in range(1,p2):
+                for k in range(1,p3):
+                    if ((i, j, k), None) in known:
+                        norm_error = known[((i, j, k), None)][0]
+                    else:
+                        a.p = [i+1,j+1,k+1] # stages from built_A on are recomputed when norm_error is read
+                        print(a.p)
+                        norm_error = np.ravel(a.norm_error)
+                        store.store(key, (i, j, k), None, norm_error)
+                    #d[str(i)+' '+str(j)+' '+str(k)] = [np.linalg.norm(a.F - a.Y), np.std(a.F_ - a.Y_, axis=0),\
+                     #                   np.linalg.norm(a.F_ - a.Y_)]
+                    d.append((str(i)+' '+str(j)+' '+str(k),np.linalg.norm(norm_error)))
     return d
 
 d = test_p(a,15,15,15)
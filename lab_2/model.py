@@ -0,0 +1,65 @@
+"""
+Fitted additive model compiled into polynomials in standard basis, as PolynomialBuilder prints them:
+Y_i = minY_i + (maxY_i - minY_i) * sum over components x_s of X_j of c_ji * a_si * sum of Lamb_sn,i * P_n(x_s)
+is one polynomial of every component for every output
+"""
+import numpy as np
+
+import lab_2.basis_generator as b_gen
+
+
+class CompiledModel(object):
+    """
+    Sum of polynomials of components of X for every output, evaluated by Horner scheme for all points,
+    components and outputs at once. Polynomials are kept in normalized points (in [0, 1] on training data),
+    where Horner scheme is well conditioned, normalization is one multiply-add per point.
+    :param poly_type: key of basis_generator.RECURRENCES
+    :param p: numbers of polynomials for X1, X2, X3
+    :param deg: dimensions of X1, X2, X3 and Y
+    :param minX, maxX, minY, maxY: ranges of components of X and Y in training data
+    :param Lamb, a, c: coefficients of the model
+    """
+
+    def __init__(self, poly_type, p, deg, minX, maxX, minY, maxY, Lamb, a, c):
+        self.minX, self.maxX = np.asarray(minX, dtype=float), np.asarray(maxX, dtype=float)
+        Lamb, a, c = np.asarray(Lamb), np.asarray(a), np.asarray(c)
+        scale = np.asarray(maxY, dtype=float) - minY
+        basis = b_gen.basis_coefficients(poly_type, max(p))
+        # coefficients (power, component, output), highest power first
+        self.coefficients = np.zeros((max(p), sum(deg[:3]), len(scale)))
+        shift = 0
+        s = 0  # component of X
+        for i in range(3):
+            for j in range(deg[i]):
+                weights = Lamb[shift:shift + p[i]] * a[s] * c[i] * scale
+                self.coefficients[::-1, s] = basis[:p[i], :max(p)].T.dot(weights)
+                shift += p[i]
+                s += 1
+        self.shift = np.asarray(minY, dtype=float)
+
+    @classmethod
+    def from_solver(cls, solver):
+        """
+        :param solver: fitted Solve, stages it needs are computed if missing
+        :return: CompiledModel
+        """
+        X_ = np.hstack(solver.X_)
+        return cls(solver.poly_type, solver.p, solver.deg, X_.min(axis=0).getA1(), X_.max(axis=0).getA1(),
+                   solver.Y_.min(axis=0).getA1(), solver.Y_.max(axis=0).getA1(), solver.Lamb, solver.a, solver.c)
+
+    def calculate_values(self, X):
+        """
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: ndarray (m, outputs) of values in original scale
+        """
+        X = (np.array(X, dtype=float, ndmin=2) - self.minX) / (self.maxX - self.minX)
+        X = X[:, :, np.newaxis]
+        values = np.empty((X.shape[0],) + self.coefficients.shape[1:])
+        values[:] = self.coefficients[0]
+        for coefficients in self.coefficients[1:]:
+            values *= X
+            values += coefficients
+        return values.sum(axis=1) + self.shift
+
+    def calculate_value(self, X):
+        return self.calculate_values([X])[0]
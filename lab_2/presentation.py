@@ -4,6 +4,7 @@ from os import name as os_name
 
 from lab_2.solve import Solve
 import lab_2.basis_generator as b_gen
+from lab_2.model import CompiledModel
 from lab_2.show_polynomial import _Polynom
 
 __author__ = 'vlad'
@@ -155,6 +156,19 @@ class PolynomialBuilder(object):
         strings.append(str(constant))
         return ' +\n'.join(strings)
 
+    def compile(self, tolerance=1e-6):
+        """
+        Compiles solution into numeric coefficients of polynomials in standard basis, see model.CompiledModel
+        :param tolerance: largest deviation from F_ of solution on training points, relative to ranges of Y
+        :return: CompiledModel
+        """
+        compiled = CompiledModel.from_solver(self._solution)
+        X = np.hstack(self._solution.X_)
+        deviation = np.max(abs(compiled.calculate_values(X) - self._solution.F_) / (self.maxY - self.minY))
+        if deviation > tolerance:
+            raise ValueError('Compiled model deviates from solution by %g of range of Y' % deviation)
+        return compiled
+
     def get_results(self):
         """
         Generates results based on given solution
@@ -4,11 +4,40 @@ from copy import deepcopy
 from scipy import special
 from openpyxl import Workbook
 
-from lab_2.system_solve import *
+from common.system_solve import *
+from common.stages import Stages
+from common.input_data import read_data
+import lab_2.basis_generator as b_gen
 from tabulate import tabulate as tb
 
 
-class Solve(object):
+class Solve(Stages):
+    # stages of the method: (method, attributes it builds, stages it depends on), in order of computation
+    STAGES = (
+        ('define_data', ('datas', 'degf'), ()),
+        ('norm_data', ('data',), ('define_data',)),
+        ('define_norm_vectors', ('X', 'Y', 'X_', 'Y_', 'mX'), ('norm_data',)),
+        ('built_B', ('B',), ('define_norm_vectors',)),
+        ('poly_func', ('poly_f',), ()),
+        ('built_A', ('A',), ('define_norm_vectors', 'poly_func')),
+        ('lamb', ('Lamb',), ('built_A', 'built_B')),
+        ('psi', ('Psi',), ('lamb',)),
+        ('built_a', ('a',), ('psi',)),
+        ('built_Fi', ('Fi',), ('built_a',)),
+        ('built_c', ('c',), ('built_Fi',)),
+        ('built_F', ('F', 'norm_error'), ('built_c',)),
+        ('built_F_', ('F_', 'error'), ('built_F',)),
+    )
+    # parameter -> first stage that has to be recomputed when it is assigned
+    PARAMS = {'filename_input': 'define_data', 'n': 'define_data', 'deg': 'define_data', 'weights': 'built_B',
+              'poly_type': 'poly_func', 'p': 'built_A', 'splitted_lambdas': 'lamb', 'solve_method': 'lamb',
+              'eps': 'lamb', 'max_p': 'built_A'}
+    # attributes that change errors of a fit besides data and p, they are part of key of DegreeCache;
+    # max_p sets ridge shift of nested fits
+    CACHE_PARAMS = ('deg', 'weights', 'poly_type', 'splitted_lambdas', 'solve_method', 'eps', 'max_p')
+    # private caches -> stages they are built from, they go with outputs of any of them
+    CACHES = {'_nested': ('define_norm_vectors',), '_nested_solvers': ('built_B',)}
+    INPUT_STAGES = ('define_data', 'norm_data')  # data of the model, see inputs
 
     def __init__(self,d):
         self.n = d['samples']
@@ -21,27 +50,25 @@ class Solve(object):
         self.poly_type = d['poly_type']
         self.splitted_lambdas = d['lambda_multiblock']
         self.eps = 1E-6
-        self.norm_error=0.0
-        self.error=0.0
+        self.solve_method = d.get('solve_method', 'auto')
+        self.max_p = None # numbers of polynomials of nested basis shared by all p <= max_p, see built_A
 
     def define_data(self):
-        f = open(self.filename_input, 'r')
-        # all data from file_input in float
-        self.datas = np.matrix([list(map(lambda x:float(x),f.readline().split())) for i in range(self.n)])
         # list of sum degrees [ 3,1,2] -> [3,4,6]
         self.degf = [sum(self.deg[:i + 1]) for i in range(len(self.deg))]
+        # all data from file_input in float, read-only rows shared with other solvers of the same file
+        self.datas = np.matrix(read_data(self.filename_input, self.n, self.degf[-1]))
 
-    def _minimize_equation(self, A, b, type='cjg'):
+    def _minimize_equation(self, A, b, type=None):
         """
         Finds such vector x that |Ax-b|->min.
         :param A: Matrix A
-        :param b: Vector b
-        :return: Vector x
+        :param b: Vector b or matrix with several right-hand sides in columns
+        :param type: name of backend from system_solve.SOLVERS, 'auto' chooses it by condition number of A
+        and keeps conjugate gradient of normal equations for ill conditioned A, as lab_2 solved them before
+        :return: Vector x (matrix with column of solution for every column of b)
         """
-        if type == 'lsq':
-            return np.linalg.lstsq(A,b)[0]
-        elif type == 'cjg':
-            return conjugate_gradient_method(A.T*A, A.T*b, self.eps)
+        return np.matrix(least_squares(A, b, type or self.solve_method, self.eps, fallback='cg_normal'))
 
     def norm_data(self):
         '''
@@ -119,63 +146,78 @@ class Solve(object):
         :param self.X: it is matrix that has vectors X1 - X3 for example
         :return: matrix A as ndarray
         '''
+        if self._uses_nested():
+            self.A = np.matrix(self._nested_basis()[:, self._nested_columns()[0]])
+        else:
+            self.A = np.matrix(b_gen.design_matrix(self.poly_type, self.X, self.p))
 
-        def mA():
-            '''
-            :param X: [X1, X2, X3]
-            :param p: [p1,p2,p3]
-            :return: m = m1*p1+m2*p2+...
-            '''
-            m = 0
-            for i in range(len(self.X)):
-                m+= self.X[i].shape[1]*(self.p[i]+1)
-            return m
+    def _uses_nested(self):
+        return self.max_p is not None and all(p <= m for p, m in zip(self.p, self.max_p))
 
-        def coordinate(v,deg):
-            '''
-            :param v: vector
-            :param deg: chebyshev degree polynom
-            :return:column with chebyshev value of coordiate vector
-            '''
-            c = np.ndarray(shape=(self.n,1), dtype = float)
-            for i in range(self.n):
-                c[i,0] = self.poly_f(deg, v[i])
-            return c
+    def _nested_basis(self):
+        '''
+        Basis for max_p, kept while X, poly_type and max_p are the same
+        :return: ndarray A with columns of all degrees up to max_p
+        '''
+        cached = getattr(self, '_nested', None)
+        if cached is None or cached[0] is not self.X or cached[1] != (self.poly_type, self.max_p):
+            self._nested = (self.X, (self.poly_type, list(self.max_p)),
+                            b_gen.design_matrix(self.poly_type, self.X, self.max_p))
+        return self._nested[2]
 
-        def vector(vec, p):
-            '''
-            :param vec: it is X that consist of X11, X12, ... vectors
-            :param p: max degree for chebyshev polynom
-            :return: part of matrix A for vector X1
-            '''
-            n, m = vec.shape
-            a = np.ndarray(shape=(n,0),dtype = float)
-            for j in range(m):
-                for i in range(p):
-                    ch = coordinate(vec[:,j],i)
-                    a = np.append(a,ch,1)
-            return a
-
-        #k = mA()
-        A = np.ndarray(shape = (self.n,0),dtype =float)
-        for i in range(len(self.X)):
-            vec = vector(self.X[i],self.p[i])
-            A = np.append(A, vec,1)
-        self.A = np.matrix(A)
+    def _nested_columns(self):
+        '''
+        Columns of current p in basis for max_p
+        :return: tuple (columns in order of A, list of columns of X1, X2, X3 ordered by degree and then by component)
+        '''
+        natural, by_degree = [], []
+        offset = 0
+        for k, X in enumerate(self.X):
+            m = X.shape[1]
+            natural += [offset + s * self.max_p[k] + d for s in range(m) for d in range(self.p[k])]
+            # when degree of a vector grows, its new columns go to the end, so the factor of the rest is reused
+            by_degree.append([offset + s * self.max_p[k] + d for d in range(self.p[k]) for s in range(m)])
+            offset += m * self.max_p[k]
+        return natural, by_degree
+
+    def _nested_lamb(self):
+        '''
+        Lamb from Gram matrix of nested basis (see system_solve.NestedLeastSquares). Groups that 'auto' would not
+        solve by Cholesky factor are solved as in the plain fit, so errors of the search are errors of the model
+        :return: ndarray Lamb
+        '''
+        A = self._nested_basis()
+        natural, by_degree = self._nested_columns()
+        groups = by_degree if self.splitted_lambdas else [sum(by_degree, [])]
+        bounds = np.cumsum([0] + [len(columns) for columns in groups])  # groups in A of the fit, in natural order
+        cached = getattr(self, '_nested_solvers', None)
+        if cached is None or cached[0] is not A or cached[1] is not self.B or len(cached[2]) != len(groups):
+            first = NestedLeastSquares.from_matrix(A, self.B)
+            solvers = [first] + [NestedLeastSquares(first.G, first.AtB) for _ in groups[1:]]
+            self._nested_solvers = (A, self.B, solvers)
+        Lamb = np.empty((A.shape[1], self.B.shape[1]))
+        for k, (columns, solver) in enumerate(zip(groups, self._nested_solvers[2])):
+            if self.solve_method == 'auto' and solver.condition(columns) < CHOLESKY_COND:
+                Lamb[columns] = solver.solve(columns)
+            else:
+                block = slice(bounds[k], bounds[k + 1])
+                Lamb[natural[block]] = self._minimize_equation(self.A[:, block], self.B)
+        return Lamb[natural]
 
     def lamb(self):
-        lamb = np.ndarray(shape = (self.A.shape[1],0), dtype = float)
-        for i in range(self.deg[3]):
-            if self.splitted_lambdas:
-                boundary_1 = self.p[0] * self.deg[0]
-                boundary_2 = self.p[1] * self.deg[1] + boundary_1
-                lamb1 = self._minimize_equation(self.A[:, :boundary_1], self.B[:, i])
-                lamb2 = self._minimize_equation(self.A[:, boundary_1:boundary_2], self.B[:, i])
-                lamb3 = self._minimize_equation(self.A[:, boundary_2:], self.B[:, i])
-                lamb = np.append(lamb, np.concatenate((lamb1, lamb2, lamb3)), axis=1)
-            else:
-                lamb = np.append(lamb, self._minimize_equation(self.A, self.B[:, i]), axis=1)
-        self.Lamb = np.matrix(lamb) #Lamb in full events
+        if self._uses_nested():
+            self.Lamb = np.matrix(self._nested_lamb())
+        elif self.splitted_lambdas:
+            boundary_1 = self.p[0] * self.deg[0]
+            boundary_2 = self.p[1] * self.deg[1] + boundary_1
+            lamb1 = self._minimize_equation(self.A[:, :boundary_1], self.B)
+            lamb2 = self._minimize_equation(self.A[:, boundary_1:boundary_2], self.B)
+            lamb3 = self._minimize_equation(self.A[:, boundary_2:], self.B)
+            lamb = np.concatenate((lamb1, lamb2, lamb3))
+        else:
+            lamb = self._minimize_equation(self.A, self.B)
+        if not self._uses_nested():
+            self.Lamb = np.matrix(lamb) #Lamb in full events
 
     def psi(self):
         def built_psi(lamb):
@@ -234,10 +276,7 @@ class Solve(object):
             self.Fi.append(self.built_F1i(self.Psi[i],self.a[:,i]))
 
     def built_c(self):
-        self.c = np.ndarray(shape = (len(self.X),0),dtype = float)
-        for i in range(self.deg[3]):
-            self.c = np.append(self.c, conjugate_gradient_method(self.Fi[i].T*self.Fi[i], self.Fi[i].T*self.Y[:,i],self.eps),\
-                          axis = 1)
+        self.c = np.matrix(batched_least_squares(np.array(self.Fi), np.asarray(self.Y).T).T)
 
     def built_F(self):
         F = np.ndarray(self.Y.shape, dtype = float)
@@ -397,17 +436,5 @@ class Solve(object):
         return '\n'.join(text)
 
     def prepare(self):
-        self.define_data()
-        self.norm_data()
-        self.define_norm_vectors()
-        self.built_B()
-        self.poly_func()
-        self.built_A()
-        self.lamb()
-        self.psi()
-        self.built_a()
-        self.built_Fi()
-        self.built_c()
-        self.built_F()
-        self.built_F_()
+        self.compute()
         self.save_to_file()
@@ -12,6 +12,7 @@ from lab_3.presentation import PolynomialBuilder, PolynomialBuilderExpTh
 from lab_3.solve import Solve
 from lab_3.solve_custom import SolveExpTh
 from lab_3.bruteforce import BruteForceWindow
+import common.kernels as kernels
 
 app = QApplication(sys.argv)
 app.setApplicationName('lab3_sa')
@@ -195,6 +196,7 @@ class MainWindow(QDialog, form_class):
 
 
 # -----------------------------------------------------#
+kernels.warm_up(background=True)  # compile while the window is opening
 form = MainWindow()
 form.setWindowTitle('System Analysis - Lab 3')
 form.show()
@@ -4,7 +4,8 @@ from numpy.polynomial import Polynomial as pnm
 from os import name as os_name
 
 from lab_3.solve import Solve
-import lab_3.basis_generator as b_gen
+import common.basis_generator as b_gen
+from common.model import CompiledModel
 
 __author__ = 'vlad'
 
@@ -26,10 +27,10 @@ class PolynomialBuilder(object):
         assert self.symbol
         self.a = solution.a.T.tolist()
         self.c = solution.c.T.tolist()
-        self.minX = [X.min(axis=0).getA1() for X in solution.X_]
-        self.maxX = [X.max(axis=0).getA1() for X in solution.X_]
-        self.minY = solution.Y_.min(axis=0).getA1()
-        self.maxY = solution.Y_.max(axis=0).getA1()
+        self.minX = [X.min(axis=0) for X in solution.X_]
+        self.maxX = [X.max(axis=0) for X in solution.X_]
+        self.minY = solution.Y_.min(axis=0)
+        self.maxY = solution.Y_.max(axis=0)
 
     def _form_lamb_lists(self):
         """
@@ -42,7 +43,7 @@ class PolynomialBuilder(object):
             for j in range(3):  # `j` is an index to choose vector from X
                 lamb_i_j = list()
                 for k in range(self._solution.dim[j]):  # `k` is an index for vector component
-                    lamb_i_jk = self._solution.Lamb[shift:shift + self._solution.deg[j], i].getA1()
+                    lamb_i_jk = self._solution.Lamb[shift:shift + self._solution.deg[j], i]
                     shift += self._solution.deg[j]
                     lamb_i_j.append(lamb_i_jk)
                 lamb_i.append(lamb_i_j)
@@ -141,6 +142,20 @@ class PolynomialBuilder(object):
         strings.insert(0, str((self.maxY[i] - self.minY[i]) * (1 + self.basis[0].coef[0]) ** (power_sum)))
         return ' * '.join(strings) + ' + ' + str((2 * self.minY[i] - self.maxY[i]))
 
+    def compile(self, tolerance=1e-6):
+        """
+        Compiles solution into numeric coefficients of polynomials in standard basis, see model.CompiledModel
+        :param tolerance: largest deviation from Solve.calculate_values on training points, relative to ranges of Y
+        :return: CompiledModel
+        """
+        compiled = CompiledModel.from_solver(self._solution)
+        X = np.hstack(self._solution.X_)
+        deviation = np.max(abs(compiled.calculate_values(X) - self._solution.calculate_values(X)) /
+                           (self.maxY - self.minY))
+        if deviation > tolerance:
+            raise ValueError('Compiled model deviates from solution by %g of range of Y' % deviation)
+        return compiled
+
     def get_results(self):
         """
         Generates results based on given solution
@@ -204,7 +219,7 @@ class PolynomialBuilder(object):
         axes.set_xlim(0, len(real))
         axes.grid()
         axes.plot(r, predicted, label='predicted')
-        if reconstructed != None:
+        if reconstructed is not None:
             axes.plot(r, reconstructed, label='reconstructed')
         axes.plot(r, real, label='real')
         axes.legend(loc='upper right', fontsize=16)
@@ -217,10 +232,10 @@ class PolynomialBuilder(object):
         XF, YF = self._solution.build_predicted(steps)
         for i, x in enumerate(self._solution.X_):
             for j, xc in enumerate(x.T):
-                self.compare_vals('X{}{}'.format(i + 1, j + 1), xc.getA1(), XF[i][j])
+                self.compare_vals('X{}{}'.format(i + 1, j + 1), xc, XF[i][j])
         for i in range(self._solution.dim[3]):
-            self.compare_vals('Y{}'.format(i + 1), self._solution.Y_[:, i].getA1(), YF[:, i],
-                              self._solution.F_[:, i].getA1())
+            self.compare_vals('Y{}'.format(i + 1), self._solution.Y_[:, i], YF[:, i],
+                              self._solution.F_[:, i])
 
 
 class PolynomialBuilderExpTh(PolynomialBuilder):
@@ -0,0 +1,137 @@
+"""
+Headless sweep over degrees x poly_type x weights x lambda_multiblock x model family.
+Data is read and normalized once for all configurations; every (family, weights) group is fitted on one solver,
+so B is built once per group and the basis with its Gram matrix once per poly_type (see Solve.max_deg).
+Usage: python -m lab_3.sweep data_3_dst.txt 45 2 2 2 2 --degrees 1 8 --output sweep.csv
+"""
+import argparse
+import csv
+from itertools import product
+from multiprocessing import Pool
+
+import numpy as np
+
+from lab_3.solve import Solve
+from lab_3.solve_custom import SolveExpTh, SolveExpTh1
+import common.basis_generator as b_gen
+
+FAMILIES = {'Solve': Solve, 'SolveExpTh': SolveExpTh, 'SolveExpTh1': SolveExpTh1}
+WEIGHTS = ('average', 'scaled')
+
+_inputs = None  # normalized data and parameters shared by all groups
+
+
+def _init_worker(inputs):
+    global _inputs
+    _inputs = inputs
+
+
+def _sweep_group(args):
+    """
+    All combinations of poly_type, lambda_multiblock and degrees for one family and weights
+    :param args: tuple (family, weights, poly_types, multiblocks, p)
+    :return: list of rows (family, weights, poly_type, multiblock, i, j, k, error, norm_error, cv_error)
+    """
+    family, weights, poly_types, multiblocks, p = args
+    cls = FAMILIES[family]
+    solver = cls.__new__(cls)
+    solver.__dict__.update(_inputs)
+    solver.weights = weights
+    solver.max_deg = [max(values) + 1 for values in p]
+    rows = []
+    for poly_type in poly_types:
+        solver.poly_type = poly_type
+        for multiblock in multiblocks:
+            solver.splitted_lambdas = multiblock
+            for degrees in product(*p):
+                solver.deg = [d + 1 for d in degrees]  # stages from built_A on are recomputed
+                cv_error = solver.cv_error
+                error = np.linalg.norm(solver.norm_error if cv_error is None else cv_error, np.inf)
+                rows.append((family, weights, poly_type, multiblock) + degrees + (error, solver.norm_error, cv_error))
+    return rows
+
+
+def sweep(d, p, families=tuple(FAMILIES), poly_types=tuple(b_gen.RECURRENCES), weights=WEIGHTS,
+          multiblocks=(False, True), processes=1):
+    """
+    Fits every configuration and returns table of errors
+    :param d: parameters of Solve (input_file, samples, dimensions and optionally folds, cv_mode, precision...),
+    degrees, poly_type, weights and lambda_multiblock in it are not used
+    :param p: lists of degrees for X1, X2, X3
+    :param families: names from FAMILIES
+    :param processes: number of processes, (family, weights) groups are spread over them
+    :return: dict column -> ndarray, rows sorted by error; error is the largest out-of-sample error when
+    d['folds'] > 1 and the largest norm_error otherwise
+    """
+    d = dict(d, output_file='', degrees=[0, 0, 0], poly_type=poly_types[0], weights=weights[0],
+             lambda_multiblock=False)
+    base = Solve(d)
+    base.compute('norm_data')
+    groups = [(family, w, list(poly_types), list(multiblocks), [list(values) for values in p])
+              for family in families for w in weights]
+    if processes == 1:
+        _init_worker(base.inputs())
+        results = list(map(_sweep_group, groups))
+    else:
+        with Pool(processes, _init_worker, (base.inputs(),)) as pool:
+            results = pool.map(_sweep_group, groups, 1)
+    return _table([row for rows in results for row in rows], base.dim[3])
+
+
+def _table(rows, outputs):
+    """
+    :param rows: rows of _sweep_group
+    :param outputs: number of outputs Y
+    :return: dict column -> ndarray sorted by error
+    """
+    order = sorted(range(len(rows)), key=lambda r: rows[r][7])
+    rows = [rows[r] for r in order]
+    table = {}
+    for c, name in enumerate(('family', 'weights', 'poly_type', 'multiblock', 'deg_1', 'deg_2', 'deg_3', 'error')):
+        table[name] = np.array([row[c] for row in rows])
+    for c, name in ((8, 'norm_error'), (9, 'cv_error')):
+        errors = np.array([row[c] if row[c] is not None else [np.nan] * outputs for row in rows], dtype=float)
+        for i in range(outputs):
+            table['%s_%d' % (name, i + 1)] = errors.reshape(len(rows), outputs)[:, i]
+    return table
+
+
+def save(table, filename):
+    """
+    :param table: result of sweep
+    :param filename: .npz saves columns as arrays, otherwise table is written as CSV
+    """
+    if filename.endswith('.npz'):
+        np.savez(filename, **table)
+        return
+    names = list(table)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(table[name].tolist() for name in names)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep of degrees, poly_type, weights, lambda_multiblock and family')
+    parser.add_argument('input_file')
+    parser.add_argument('samples', type=int)
+    parser.add_argument('dimensions', type=int, nargs=4, help='dimensions of X1, X2, X3 and Y')
+    parser.add_argument('--degrees', type=int, nargs=2, default=[1, 5], metavar=('FROM', 'TO'),
+                        help='range of degrees for every vector')
+    parser.add_argument('--families', nargs='+', default=list(FAMILIES), choices=list(FAMILIES))
+    parser.add_argument('--poly-types', nargs='+', default=list(b_gen.RECURRENCES))
+    parser.add_argument('--weights', nargs='+', default=list(WEIGHTS), choices=list(WEIGHTS))
+    parser.add_argument('--multiblock', nargs='+', default=['no', 'yes'], choices=['no', 'yes'])
+    parser.add_argument('--folds', type=int, default=0, help='folds of cross-validation, 0 for in-sample error')
+    parser.add_argument('--cv-mode', default='kfold', choices=['kfold', 'time'])
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--output', default='sweep.csv', help='.csv or .npz')
+    args = parser.parse_args()
+    degrees = list(range(args.degrees[0], args.degrees[1] + 1))
+    table = sweep(dict(input_file=args.input_file, samples=args.samples, dimensions=args.dimensions,
+                       folds=args.folds, cv_mode=args.cv_mode),
+                  [degrees] * 3, args.families, args.poly_types, args.weights,
+                  [value == 'yes' for value in args.multiblock], args.processes)
+    save(table, args.output)
+    for r in range(min(10, len(table['error']))):
+        print(*(table[name][r] for name in table))
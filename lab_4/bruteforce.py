@@ -1,14 +1,50 @@
 #coding: utf8
 
-from PyQt5.QtCore import pyqtSlot, pyqtSignal
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QThread
 from PyQt5.QtWidgets import QDialog, QMessageBox
 from PyQt5.uic import loadUiType
 
-from lab_4.calculate_optimal_degrees import *
+from common.calculate_optimal_degrees import *
+from common.degree_cache import DEFAULT_PATH
+from lab_4.read_data import read_data
 from lab_4.solve_custom import SolveExpTh
 from lab_4.solve import Solve
 
-form_class, base_class = loadUiType('lab_3/bruteforce_window.ui')
+form_class, base_class = loadUiType('lab_4/bruteforce_window.ui')
+
+
+class DegreeSearchThread(QThread):
+    """
+    Runs determine_deg out of GUI thread, reports every fit and every new best combination
+    """
+    progress = pyqtSignal(int, int)  # combinations done (fitted or taken from cache), expected fits
+    improved = pyqtSignal(object)  # new best result (combination, error, norm_error, cv_error)
+    done = pyqtSignal(object)  # best result or None, also after cancellation
+
+    def __init__(self, solver, p, strategy, budget, folds, cv_mode, parent=None):
+        super(DegreeSearchThread, self).__init__(parent)
+        self.solver = solver
+        self.p = p
+        self.strategy = strategy
+        self.budget = budget
+        self.folds = folds
+        self.cv_mode = cv_mode
+        self.best = None
+
+    def run(self):
+        result = None
+        try:
+            result = determine_deg(self.solver, self.p[0], self.p[1], self.p[2], strategy=self.strategy,
+                                   budget=self.budget, listener=self._fitted, stop=self.isInterruptionRequested,
+                                   cache=DEFAULT_PATH, folds=self.folds, cv_mode=self.cv_mode)
+        finally:
+            self.done.emit(result)
+
+    def _fitted(self, search, result, samples):
+        self.progress.emit(search.fits + search.reused, search.total)
+        if search.best_result is not self.best:
+            self.best = search.best_result
+            self.improved.emit(self.best)
 
 
 class BruteForceWindow(QDialog, form_class):
@@ -17,11 +53,14 @@ class BruteForceWindow(QDialog, form_class):
     def __init__(self, *args):
         super(BruteForceWindow, self).__init__(*args)
         self.setupUi(self)
+        self.search_thread = None
+        self.cancel_button.setEnabled(False)
 
     @staticmethod
     def launch(parent):
         dialog = BruteForceWindow(parent)
         dialog.params = parent._get_params()
+        dialog.input_path = parent.input_path
         dialog.custom_struct = parent.custom_func_struct
         dialog.update_degrees.connect(parent.update_degrees)
         dialog.setWindowTitle("Polynomial's degree finder")
@@ -32,20 +71,73 @@ class BruteForceWindow(QDialog, form_class):
         self.low_edge  = [self.from_1.value(), self.from_2.value(), self.from_3.value()]
         self.high_edge = [self.to_1.value(), self.to_2.value(), self.to_3.value()]
         self.step = [self.st_1.value(), self.st_2.value(), self.st_3.value()]
+        params = dict(self.params, dimensions=list(self.params['dimensions']))
+        params['dimensions'][3] = 1  # y2 and y3 are not used, as in SolverManager
         if self.custom_struct:
-            solver = SolveExpTh(self.params)
+            solver = SolveExpTh(params)
         else:
-            solver = Solve(self.params)
+            solver = Solve(params)
+        try:
+            _, data = read_data(self.input_path)
+        except Exception as e:
+            QMessageBox.warning(self, 'Error!', 'Error happened during reading of data: ' + str(e))
+            return
+        solver.load_data(data[1:1 + solver.n, :-2])  # samples of the first fit of SolverManager
         p = [[i for i in range(self.low_edge[j], self.high_edge[j]+1, self.step[j])] for j in range(len(self.step))]
-        best_deg = determine_deg(solver, p[0], p[1], p[2])
+        self.search_thread = DegreeSearchThread(solver, p, list(STRATEGIES)[self.strategy.currentIndex()],
+                                                self.budget.value(), self.folds.value(),
+                                                ['kfold', 'time'][self.cv_mode.currentIndex()], self)
+        self.search_thread.progress.connect(self.search_progress)
+        self.search_thread.improved.connect(self.search_improved)
+        self.search_thread.done.connect(self.search_done)
+        self.pushButton.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress.setValue(0)
+        self.best_label.setText('Searching...')
+        self.search_thread.start()
+        return
+
+    @pyqtSlot()
+    def cancelled(self):
+        if self.search_thread is not None:
+            self.search_thread.requestInterruption()
+            self.cancel_button.setEnabled(False)
+        return
+
+    @pyqtSlot(int, int)
+    def search_progress(self, fits, total):
+        self.progress.setMaximum(max(total, fits))
+        self.progress.setValue(fits)
+
+    @pyqtSlot(object)
+    def search_improved(self, best):
+        self.res_1.setValue(best[0][0])
+        self.res_2.setValue(best[0][1])
+        self.res_3.setValue(best[0][2])
+        text = 'Best so far: ' + str(best[0]) + ', norm error: ' + ', '.join('%.6g' % e for e in best[2])
+        if best[3] is not None:
+            text += ', out of sample: ' + ', '.join('%.6g' % e for e in best[3])
+        self.best_label.setText(text)
+
+    @pyqtSlot(object)
+    def search_done(self, best_deg):
+        cancelled = self.search_thread.isInterruptionRequested()
+        self.search_thread.wait()
+        self.search_thread = None
+        self.pushButton.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        if not cancelled:
+            self.progress.setValue(self.progress.maximum())
+        if best_deg is None:
+            self.best_label.setText('Search was cancelled before any fit' if cancelled else 'Search failed')
+            return
         bd = best_deg[0]
-        self.res_1.setValue(bd[0])
-        self.res_2.setValue(bd[1])
-        self.res_3.setValue(bd[2])
+        self.search_improved(best_deg)
 
         msgbox = QMessageBox()
 
-        msgbox.setText('Best degrees:'+bd.__str__()+'.')
+        msgbox.setText(('Search was cancelled. Best degrees found:' if cancelled else 'Best degrees:') +
+                       bd.__str__()+'.')
         msgbox.setInformativeText("Do you want to copy degrees in main window?")
         msgbox.setStandardButtons(QMessageBox.Ok | QMessageBox.Cancel)
         msgbox.setDefaultButton(QMessageBox.Ok)
@@ -53,15 +145,15 @@ class BruteForceWindow(QDialog, form_class):
         if ret == QMessageBox.Ok:
             self.update_degrees.emit(bd[0],bd[1], bd[2])
             self.close()
-        # result = QMessageBox.question(self, 'Long-time operation',
-        #                               'Adjusting degrees lasts long. Do you want to perform it?',
-        #                               QMessageBox.Ok | QMessageBox.No)
-        # if result == QMessageBox.Ok:
-        #     BruteForceWindow.launch(self)
-
-        #self.update_degrees.emit(3,3,3)
         return
 
+    def closeEvent(self, event):
+        if self.search_thread is not None:  # do not leave the search running without window
+            self.search_thread.done.disconnect()
+            self.search_thread.requestInterruption()
+            self.search_thread.wait()
+            self.search_thread = None
+        super(BruteForceWindow, self).closeEvent(event)
+
     def _process_bruteforce(self, lower, upper):
         pass
-
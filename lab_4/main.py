@@ -10,6 +10,7 @@ from PyQt5.uic import loadUiType
 
 from lab_4.solver_manager import * #SolverManager
 from lab_4.bruteforce import BruteForceWindow
+import common.kernels as kernels
 
 app = QApplication(sys.argv)
 app.setApplicationName('lab4_sa')
@@ -187,6 +188,7 @@ class MainWindow(QDialog, form_class):
 
 
 # -----------------------------------------------------#
+kernels.warm_up(background=True)  # compile while the window is opening
 form = MainWindow()
 form.setWindowTitle('System Analysis - Lab 4')
 form.show()
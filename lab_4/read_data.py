@@ -1,10 +1,110 @@
+"""
+Tables of xlsx files with binary sidecar cache: the first sheet is parsed once and kept next to the file
+in directory <file>.cache as time.npy and data.npy, which later loads memory-map instead of parsing xlsx.
+Cache is rebuilt when size of the file changes or its mtime changes and sha1 of its content too.
+Usage: python -m lab_4.read_data norm.xlsx warn.xlsx converts files ahead
+"""
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
 import pandas as pd
 
+VERSION = 1  # of layout of cache, caches of other versions are rebuilt
+
+
+def read_data(filename = 'norm.xlsx', cache=True):
+    """
+    :param filename: xlsx file
+    :param cache: load sidecar cache, converting the file first when cache is missing or stale;
+    False parses the file without touching cache
+    :return: (time, data), list of row labels of the first sheet and read-only ndarray (rows, columns) of its values
+    """
+    if not cache:
+        return _parse(filename)
+    directory = cache_path(filename)
+    try:
+        if not _is_fresh(filename, directory):
+            convert(filename)
+    except OSError:  # directory of file is not writable
+        return _parse(filename)
+    t = np.load(os.path.join(directory, 'time.npy')).tolist()
+    return t, np.load(os.path.join(directory, 'data.npy'), mmap_mode='r')
+
+
+def cache_path(filename):
+    return filename + '.cache'
+
+
+def convert(filename):
+    """
+    Parses xlsx file and writes its sidecar cache
+    :param filename: xlsx file
+    :return: directory of cache
+    """
+    t, data = _parse(filename)
+    directory = cache_path(filename)
+    os.makedirs(directory, exist_ok=True)
+    stamp = os.path.join(directory, 'source.json')
+    if os.path.exists(stamp):
+        os.remove(stamp)  # cache without stamp is stale, so an interrupted conversion is redone
+    for name, values in (('time', np.asarray(t)), ('data', data)):
+        path = os.path.join(directory, name + '.npy')
+        np.save(path + '.tmp.npy', values)
+        os.replace(path + '.tmp.npy', path)
+    _write_stamp(directory, _source(filename))
+    return directory
+
 
-def read_data(filename = 'norm.xlsx'):
+def _parse(filename):
     xl_file = pd.ExcelFile(filename)
-    # print(xl_file.sheet_names[0])
     dfs = xl_file.parse(xl_file.sheet_names[0])
-    dfd = dfs.as_matrix()
+    dfd = dfs.to_numpy(dtype=float)
+    dfd.flags.writeable = False
     t = dfs.T.columns.values.tolist()
     return t, dfd
+
+
+def _source(filename):
+    """
+    :return: dict of mtime, size and sha1 of file
+    """
+    stat = os.stat(filename)
+    with open(filename, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return {'version': VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': digest}
+
+
+def _write_stamp(directory, source):
+    stamp = os.path.join(directory, 'source.json')
+    with open(stamp + '.tmp', 'w') as f:
+        json.dump(source, f)
+    os.replace(stamp + '.tmp', stamp)
+
+
+def _is_fresh(filename, directory):
+    """
+    :return: True if cache in directory was converted from the current content of file
+    """
+    try:
+        with open(os.path.join(directory, 'source.json')) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return False
+    stat = os.stat(filename)
+    if cached.get('version') != VERSION or cached.get('size') != stat.st_size:
+        return False
+    if cached.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    source = _source(filename)
+    if source['sha1'] != cached.get('sha1'):
+        return False
+    _write_stamp(directory, source)  # file was touched or copied, content is the same
+    return True
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:]:
+        print('%s -> %s' % (name, convert(name)))
@@ -1,15 +1,56 @@
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
 
 from scipy import special
 from openpyxl import Workbook
 
-from lab_4.system_solve import *
+from common.system_solve import *
+from common.stages import Stages
+import common.basis_generator as b_gen
+import common.kernels as kernels
+from common.model import Model, normalize_points
 from lab_4.forecast_ar import ar as forecast
 
 
 
-class Solve(object):
+class Solve(Stages):
     OFFSET = 1e-10
+    _fit_rows = None  # samples a and c are fitted on, None for all (see cross_validate)
+    FAMILY = kernels.LOG  # transform of aggregate functions in compiled kernels
+    # handling of points in calculate_values: negative normalized components clamped, NaN components set to 1
+    CLAMP_POINTS = True
+    FILL_NAN_POINTS = True
+    # stages of the method: (method, attributes it builds, stages it depends on), in order of computation
+    STAGES = (
+        ('norm_data', ('data',), ()),  # datas comes from load_data
+        ('define_norm_vectors', ('X', 'Y', 'X_', 'Y_', 'mX', 'minX', 'maxX', 'minY', 'maxY'), ('norm_data',)),
+        ('built_B', ('B', 'B_log'), ('define_norm_vectors',)),
+        ('poly_func', ('poly_f',), ()),
+        ('built_A', ('A', 'A_log'), ('define_norm_vectors', 'poly_func')),
+        ('lamb', ('Lamb',), ('built_A', 'built_B')),
+        ('psi', ('Psi', 'Psi_log'), ('lamb',)),
+        ('built_a', ('a',), ('psi',)),
+        ('built_Fi', ('Fi', 'Fi_log'), ('built_a',)),
+        ('built_c', ('c',), ('built_Fi',)),
+        ('built_F', ('F', 'F_log', 'norm_error'), ('built_c',)),
+        ('built_F_', ('F_', 'error'), ('built_F',)),
+        ('cross_validate', ('cv_error',), ('built_F',)),
+        ('build_predicted', ('XF', 'YF'), ('built_F_',)),
+    )
+    # parameter -> first stage that has to be recomputed when it is assigned
+    PARAMS = {'datas': 'norm_data', 'dim': 'define_norm_vectors', 'weights': 'built_B', 'poly_type': 'poly_func',
+              'deg': 'built_A', 'splitted_lambdas': 'lamb', 'solve_method': 'lamb', 'eps': 'lamb',
+              'dtype': 'norm_data', 'refine_tol': 'lamb', 'max_deg': 'built_A',
+              'folds': 'cross_validate', 'cv_mode': 'cross_validate', 'pred_step': 'build_predicted'}
+    # attributes that change errors of a fit besides data and deg, they are part of key of DegreeCache;
+    # max_deg sets ridge shift of nested fits
+    CACHE_PARAMS = ('dim', 'weights', 'poly_type', 'splitted_lambdas', 'solve_method', 'eps', 'dtype', 'folds',
+                    'cv_mode', 'max_deg', 'refine_tol')
+    # private caches -> stages they are built from, they go with outputs of any of them, so a new fit does not hold
+    # the previous A_log and its factors while building its own
+    CACHES = {'_nested': ('define_norm_vectors',), '_nested_solvers': ('built_B',), '_lamb_factors': ('built_A',),
+              '_fold_pieces': ('built_A', 'built_B'), '_nested_fold_pieces': ('define_norm_vectors', 'built_B')}
+    INPUT_STAGES = ('norm_data',)  # data of the model, see inputs
 
     def __init__(self, d):
         self.n = d['samples']
@@ -21,50 +62,48 @@ class Solve(object):
         self.weights = d['weights']
         self.poly_type = d['poly_type']
         self.splitted_lambdas = d['lambda_multiblock']
-        self.norm_error = 0.0
         self.eps = 1E-8
-        self.error = 0.0
+        self.solve_method = d.get('solve_method', 'auto')
+        # 'single' precision keeps normalized data, A, Psi and Fi in float32, solutions are refined in float64
+        self.dtype = np.float32 if d.get('precision', 'double') == 'single' else np.float64
+        self.refine_tol = d.get('refine_tol', 1e-6)
+        self.use_kernels = d.get('use_kernels', True) and kernels.ENABLED  # compiled loops if Numba is installed
+        self.max_deg = None  # numbers of polynomials of nested basis shared by all deg <= max_deg, see built_A
+        self.folds = d.get('folds', 0)  # number of folds of cross-validation, 0 for none
+        self.cv_mode = d.get('cv_mode', 'kfold')  # 'kfold' or 'time', see cross_validate
         self.pred_step = d['pred_steps']
 
     def load_data(self, data):
-        self.datas = data
-        self.datas = np.asmatrix(self.datas)
+        self.datas = np.asarray(data, dtype=float)
         # list of sum degrees [ 3,1,2] -> [3,4,6]
         self.dim_integral = [sum(self.dim[:i + 1]) for i in range(len(self.dim))]
 
-    def _minimize_equation(self, A, b, type='cjg2'):
+    def _minimize_equation(self, A, b, type=None):
         """
         Finds such vector x that |Ax-b|->min.
         :param A: Matrix A
-        :param b: Vector b
-        :return: Vector x
-        """
-        if type == 'lsq':
-            return np.linalg.lstsq(A, b)[0]
-        elif type == 'cjg':
-            return conjugate_gradient_method(A.T * A, A.T * b, self.eps)
-        elif type == 'cjg2':
-            return conjugate_gradient_method_v2(A.T * A, A.T * b, self.eps)
-        elif type == 'cjg3':
-            return conjugate_gradient_method_v3(A.T * A, A.T * b, self.eps)
+        :param b: Vector b or matrix with several right-hand sides in columns
+        :param type: name of backend from system_solve.SOLVERS, 'auto' chooses it by condition number of A
+        :return: Vector x (matrix with column of solution for every column of b)
+        """
+        return least_squares(A, b, type or self.solve_method, self.eps, refine=self._refine())
+
+    def _refine(self):
+        """
+        :return: tolerance of iterative refinement for float32 fit, None for float64 one
+        """
+        return self.refine_tol if self.dtype == np.float32 else None
 
     def norm_data(self):
         """
         norm vectors value to value in [0,1]
         :return: float number in [0,1]
         """
-        n, m = self.datas.shape
-        vec = np.ndarray(shape=(n, m), dtype=float)
-        for j in range(m):
-            minv = np.min(self.datas[:, j])
-            maxv = np.max(self.datas[:, j])
-            if minv == maxv:
-                for i in range(n):
-                    vec[i, j] = 1
-            else:
-                for i in range(n):
-                    vec[i, j] = (self.datas[i, j] - minv) / (maxv - minv)
-        self.data = np.matrix(vec)
+        minv = self.datas.min(axis=0)
+        diff = self.datas.max(axis=0) - minv
+        self.data = np.subtract(self.datas, minv, dtype=self.dtype)
+        self.data /= np.where(diff == 0, 1, diff)
+        self.data[:, diff == 0] = 1  # constant columns
 
     def define_norm_vectors(self):
         """
@@ -74,12 +113,12 @@ class Solve(object):
         X1 = self.data[:, :self.dim_integral[0]]
         X2 = self.data[:, self.dim_integral[0]:self.dim_integral[1]]
         X3 = self.data[:, self.dim_integral[1]:self.dim_integral[2]]
-        # matrix of vectors i.e.X = [[X11,X12],[X21],...]
+        # matrix of vectors i.e.X = [[X11,X12],[X21],...], all blocks are views into data and datas
         self.X = [X1, X2, X3]
-        self.minX = np.min(self.datas[:, :self.dim_integral[2]].A, axis=0)
-        self.maxX = np.max(self.datas[:, :self.dim_integral[2]].A, axis=0)
-        self.minY = np.min(self.datas[:, self.dim_integral[2]:].A, axis=0)
-        self.maxY = np.max(self.datas[:, self.dim_integral[2]:].A, axis=0)
+        self.minX = self.datas[:, :self.dim_integral[2]].min(axis=0)
+        self.maxX = self.datas[:, :self.dim_integral[2]].max(axis=0)
+        self.minY = self.datas[:, self.dim_integral[2]:].min(axis=0)
+        self.maxY = self.datas[:, self.dim_integral[2]:].max(axis=0)
         # number columns in matrix X
         self.mX = self.dim_integral[2]
         # matrix, that consists of i.e. Y1,Y2
@@ -94,15 +133,15 @@ class Solve(object):
             Vector B as average of max and min in Y. B[i] =max Y[i,:]
             :return:
             """
-            b = np.tile((self.Y.max(axis=1) + self.Y.min(axis=1)) / 2, (1, self.dim[3]))
-            return b
+            b = (self.Y.max(axis=1) + self.Y.min(axis=1)) / 2
+            return np.tile(b[:, None], (1, self.dim[3]))
 
         def B_scaled():
             """
             Vector B  = Y
-            :return:
+            :return: view of Y, B is never modified
             """
-            return deepcopy(self.Y)
+            return self.Y
 
         if self.weights == 'average':
             self.B = B_average()
@@ -130,6 +169,29 @@ class Solve(object):
         elif self.poly_type == 'arctg':
             self.poly_f = lambda deg, x: (np.arctan(x) + np.pi / 2) / np.pi
 
+    def _basis_matrix(self, dtype=None, degrees=None):
+        """
+        Values of basis polynomials for all samples of X1, X2, X3 in one preallocated matrix
+        :param dtype: precision of evaluation, by default precision of the fit
+        :param degrees: numbers of polynomials for X1, X2, X3, by default deg
+        :return: ndarray with columns grouped by vector, component and degree
+        """
+        dtype = dtype or self.dtype
+        degrees = degrees or self.deg
+        if self.poly_type in b_gen.RECURRENCES:
+            generator = kernels if self.use_kernels else b_gen
+            return generator.design_matrix(self.poly_type, [X.astype(dtype, copy=False) for X in self.X], degrees)
+        # polynomials without recurrence are evaluated column by column
+        n = self.X[0].shape[0]
+        A = np.empty((n, sum(self.X[i].shape[1] * degrees[i] for i in range(len(self.X)))), dtype=dtype)
+        shift = 0
+        for i, vec in enumerate(self.X):
+            for j in range(vec.shape[1]):
+                for deg in range(degrees[i]):
+                    A[:, shift] = self.poly_f(deg, np.asarray(vec[:, j]).ravel())
+                    shift += 1
+        return A
+
     def built_A(self):
         """
         built matrix A on shifted polynomials Chebysheva
@@ -137,144 +199,179 @@ class Solve(object):
         :param self.X: it is matrix that has vectors X1 - X3 for example
         :return: matrix A as ndarray
         """
+        if self._uses_nested():
+            A, A_log = self._nested_basis()
+            columns = self._nested_columns()[0]
+            self.A, self.A_log = A[:, columns], A_log[:, columns]
+        else:
+            self.A, self.A_log = self._transformed_basis(self.deg)
 
-        def mA():
-            """
-            :param X: [X1, X2, X3]
-            :param p: [p1,p2,p3]
-            :return: m = m1*p1+m2*p2+...
-            """
-            m = 0
-            for i in range(len(self.X)):
-                m += self.X[i].shape[1] * (self.deg[i] + 1)
-            return m
+    def _transformed_basis(self, degrees):
+        """
+        Matrix A and its transform that takes place of log(A + 1) in the model
+        :param degrees: numbers of polynomials for X1, X2, X3
+        :return: tuple (A, A_log) in precision of the fit
+        """
+        A = self._basis_matrix(np.float64, degrees)  # log amplifies rounding of A near -1, so it is taken in float64
+        A_log = A + (1 + self.OFFSET)
+        np.log(A_log, out=A_log)
+        return A.astype(self.dtype, copy=False), A_log.astype(self.dtype, copy=False)
 
-        def coordinate(v, deg):
-            """
-            :param v: vector
-            :param deg: chebyshev degree polynom
-            :return:column with chebyshev value of coordiate vector
-            """
-            c = np.ndarray(shape=(self.n, 1), dtype=float)
-            for i in range(self.n):
-                c[i, 0] = self.poly_f(deg, v[i])
-            return c
+    def _uses_nested(self):
+        return self.max_deg is not None and all(d <= m for d, m in zip(self.deg, self.max_deg))
 
-        def vector(vec, p):
-            """
-            :param vec: it is X that consist of X11, X12, ... vectors
-            :param p: max degree for chebyshev polynom
-            :return: part of matrix A for vector X1
-            """
-            n, m = vec.shape
-            a = np.ndarray(shape=(n, 0), dtype=float)
-            for j in range(m):
-                for i in range(p):
-                    ch = coordinate(vec[:, j], i)
-                    a = np.append(a, ch, 1)
-            return a
-
-        # k = mA()
-        A = np.ndarray(shape=(self.n, 0), dtype=float)
-        for i in range(len(self.X)):
-            vec = vector(self.X[i], self.deg[i])
-            A = np.append(A, vec, 1)
-        self.A = np.matrix(A)
-        self.A_log = np.log(self.A + 1 + self.OFFSET)
+    def _nested_basis(self):
+        """
+        Transformed basis for max_deg, kept while X, poly_type and max_deg are the same
+        :return: tuple (A, A_log) with columns of all degrees up to max_deg
+        """
+        cached = getattr(self, '_nested', None)
+        if cached is None or cached[0] is not self.X or cached[1] != (self.poly_type, self.max_deg):
+            self._nested = (self.X, (self.poly_type, list(self.max_deg)), self._transformed_basis(self.max_deg))
+        return self._nested[2]
+
+    def _nested_columns(self):
+        """
+        Columns of current deg in basis for max_deg
+        :return: tuple (columns in order of A, list of columns of X1, X2, X3 ordered by degree and then by component)
+        """
+        natural, by_degree = [], []
+        offset = 0
+        for k, X in enumerate(self.X):
+            m = X.shape[1]
+            natural += [offset + s * self.max_deg[k] + d for s in range(m) for d in range(self.deg[k])]
+            # when degree of a vector grows, its new columns go to the end, so the factor of the rest is reused
+            by_degree.append([offset + s * self.max_deg[k] + d for d in range(self.deg[k]) for s in range(m)])
+            offset += m * self.max_deg[k]
+        return natural, by_degree
+
+    def _nested_lamb(self):
+        """
+        Lamb from Gram matrix of nested basis (see system_solve.NestedLeastSquares)
+        :return: ndarray Lamb
+        """
+        A_log = self._nested_basis()[1]
+        natural, by_degree = self._nested_columns()
+        groups = by_degree if self.splitted_lambdas else [sum(by_degree, [])]
+        cached = getattr(self, '_nested_solvers', None)
+        if cached is None or cached[0] is not A_log or cached[1] is not self.B_log or len(cached[2]) != len(groups):
+            first = NestedLeastSquares.from_matrix(A_log, self.B_log)
+            solvers = [first] + [NestedLeastSquares(first.G, first.AtB) for _ in groups[1:]]
+            self._nested_solvers = (A_log, self.B_log, solvers)
+        Lamb = np.empty((A_log.shape[1], self.B_log.shape[1]))
+        for columns, solver in zip(groups, self._nested_solvers[2]):
+            Lamb[columns] = solver.solve(columns)
+        return Lamb[natural]
+
+    def _lamb_solvers(self):
+        """
+        Factorizations of A_log (or of its blocks for X1, X2, X3 in lambda_multiblock mode).
+        Blocks are factored concurrently and kept until A_log or the mode changes, so every output reuses them
+        :return: list of (first column, backend) pairs
+        """
+        if self.splitted_lambdas:
+            boundary_1 = self.deg[0] * self.dim[0]
+            boundary_2 = self.deg[1] * self.dim[1] + boundary_1
+            boundaries = [0, boundary_1, boundary_2, self.A_log.shape[1]]
+        else:
+            boundaries = [0, self.A_log.shape[1]]
+        cached = getattr(self, '_lamb_factors', None)
+        if cached is None or cached[0] is not self.A_log or cached[1] != boundaries:
+            blocks = [self.A_log[:, boundaries[i]:boundaries[i + 1]] for i in range(len(boundaries) - 1)]
+            with ThreadPoolExecutor(len(blocks)) as pool:
+                solvers = list(pool.map(lambda block: factorize(block, self.solve_method, self.eps), blocks))
+            self._lamb_factors = (self.A_log, boundaries, list(zip(boundaries, solvers)))
+        return self._lamb_factors[2]
 
     def lamb(self):
-        lamb = np.ndarray(shape=(self.A.shape[1], 0), dtype=float)
-        for i in range(self.dim[3]):
-            if self.splitted_lambdas:
-                boundary_1 = self.deg[0] * self.dim[0]
-                boundary_2 = self.deg[1] * self.dim[1] + boundary_1
-                lamb1 = self._minimize_equation(self.A_log[:, :boundary_1], self.B_log[:, i])
-                lamb2 = self._minimize_equation(self.A_log[:, boundary_1:boundary_2], self.B_log[:, i])
-                lamb3 = self._minimize_equation(self.A_log[:, boundary_2:], self.B_log[:, i])
-                lamb = np.append(lamb, np.concatenate((lamb1, lamb2, lamb3)), axis=1)
-            else:
-                lamb = np.append(lamb, self._minimize_equation(self.A_log, self.B_log[:, i]), axis=1)
-        self.Lamb = np.matrix(lamb)  # Lamb in full events
+        if self._uses_nested():
+            self.Lamb = self._nested_lamb()
+        else:
+            solvers = self._lamb_solvers()
+            refine = self._refine()
+            with ThreadPoolExecutor(len(solvers)) as pool:
+                lamb = list(pool.map(lambda item: item[1].solve(self.B_log) if refine is None
+                                     else item[1].solve_refined(self.B_log, refine), solvers))
+            self.Lamb = np.concatenate(lamb)  # Lamb in full events
+
+    def _psi_stack(self):
+        """
+        Sums of lambda*A_log over degrees of every component, for all outputs at once
+        :return: ndarray (outputs, n, mX), [i] is matrix psi for Y[:, i] in log scale
+        """
+        A = self.A_log
+        Lamb = self.Lamb.astype(A.dtype, copy=False)
+        if self.use_kernels:
+            return kernels.segment_dot(A[None], Lamb, np.repeat(self.deg[:len(self.X)], self.dim[:len(self.X)]))
+        n = A.shape[0]
+        psi = np.empty((Lamb.shape[1], n, self.mX), dtype=A.dtype)
+        q = 0  # iterator in lamb and A
+        l = 0  # iterator in columns psi
+        for k in range(len(self.X)):  # choose X1 or X2 or X3
+            m = self.X[k].shape[1]
+            width = m * self.deg[k]
+            # columns of block are (component, degree) pairs, reduce over degree for every component at once
+            psi[:, :, l:l + m] = np.einsum('nsd,sdr->rns', A[:, q:q + width].reshape(n, m, self.deg[k]),
+                                           Lamb[q:q + width].reshape(m, self.deg[k], -1))
+            q += width
+            l += m
+        return psi
 
     def psi(self):
-        def built_psi(lamb):
-            """
-            return matrix xi1 for b1 as matrix
-            :param A:
-            :param lamb:
-            :param p:
-            :return: matrix psi, for each Y
-            """
-            psi = np.ndarray(shape=(self.n, self.mX), dtype=float)
-            q = 0  # iterator in lamb and A
-            l = 0  # iterator in columns psi
-            for k in range(len(self.X)):  # choose X1 or X2 or X3
-                for s in range(self.X[k].shape[1]):  # choose X11 or X12 or X13
-                    for i in range(self.X[k].shape[0]):
-                        psi[i, l] = self.A_log[i, q:q + self.deg[k]] * lamb[q:q + self.deg[k], 0]
-                    q += self.deg[k]
-                    l += 1
-            return np.matrix(psi)
-
-        self.Psi_log = []  # as list because psi[i] is matrix(not vector)
-        self.Psi = list()
-        for i in range(self.dim[3]):
-            self.Psi_log.append(built_psi(self.Lamb[:, i]))
-            self.Psi.append(np.exp(self.Psi_log[i]) - 1 - self.OFFSET)
+        self.Psi_log = self._psi_stack()  # stack of matrices psi, one for each Y
+        self.Psi = np.exp(self.Psi_log) - 1 - self.OFFSET
 
     def built_a(self):
-        self.a = np.ndarray(shape=(self.mX, 0), dtype=float)
-        for i in range(self.dim[3]):
-            a1 = self._minimize_equation(self.Psi_log[i][:, :self.dim_integral[0]],
-                                         np.log(self.Y[:, i] + 1 + self.OFFSET))
-            a2 = self._minimize_equation(self.Psi_log[i][:, self.dim_integral[0]:self.dim_integral[1]],
-                                         np.log(self.Y[:, i] + 1 + self.OFFSET))
-            a3 = self._minimize_equation(self.Psi_log[i][:, self.dim_integral[1]:],
-                                         np.log(self.Y[:, i] + 1 + self.OFFSET))
-            # temp = self._minimize_equation(self.Psi[i], self.Y[:, i])
-            # self.a = np.append(self.a, temp, axis=1)
-            self.a = np.append(self.a, np.vstack((a1, a2, a3)), axis=1)
+        self.a = self._solve_blocks(self.Psi_log)
+
+    def _solve_outputs(self, matrices):
+        """
+        Solves |M[i]x - log(Y[:, i] + 1)| -> min for every output i at once
+        :param matrices: stack of equally shaped matrices, one for each Y
+        :return: ndarray with solution for Y[:, i] in column i
+        """
+        rhs = np.log(self.Y.T + 1 + self.OFFSET)
+        if self._fit_rows is not None:
+            matrices, rhs = matrices[:, self._fit_rows], rhs[:, self._fit_rows]
+        return batched_least_squares(matrices, rhs, self._refine()).T
+
+    def _solve_blocks(self, stack):
+        """
+        Solves |M[i][:, Xk]x - log(Y[:, i] + 1)| -> min separately for columns of X1, X2, X3 and every output i
+        :param stack: ndarray (outputs, n, mX)
+        :return: ndarray (mX, outputs) with solution for Y[:, i] in column i
+        """
+        bounds = [0] + self.dim_integral[:len(self.X)]
+        return np.vstack([self._solve_outputs(stack[:, :, bounds[k]:bounds[k + 1]]) for k in range(len(self.X))])
 
     def built_F1i(self, psi, a):
         """
-        not use; it used in next function
-        :param psi: matrix psi (only one
-        :param a: vector with shape = (6,1)
-        :param dim_integral:  = [3,4,6]//fibonacci of deg
-        :return: matrix of (three) components with F1 F2 and F3
+        Sums a*psi over components of X1, X2 and X3 for every output at once
+        :param psi: stack of matrices psi, shape (outputs, n, mX)
+        :param a: matrix a, shape (mX, outputs)
+        :return: stack of matrices with components F1 F2 and F3, shape (outputs, n, 3)
         """
-        m = len(self.X)  # m  = 3
-        F1i = np.ndarray(shape=(self.n, m), dtype=float)
+        a = a.astype(psi.dtype, copy=False)
+        if self.use_kernels:
+            return kernels.segment_dot(psi, a, self.dim[:len(self.X)])
+        F1i = np.empty(psi.shape[:2] + (len(self.X),), dtype=psi.dtype)
         k = 0  # point of beginning column to multiply
-        for j in range(m):  # 0 - 2
-            for i in range(self.n):  # 0 - 49
-                F1i[i, j] = psi[i, k:self.dim_integral[j]] * a[k:self.dim_integral[j], 0]
+        for j in range(len(self.X)):  # 0 - 2
+            F1i[:, :, j] = np.einsum('rns,sr->rn', psi[:, :, k:self.dim_integral[j]], a[k:self.dim_integral[j]])
             k = self.dim_integral[j]
-        return np.matrix(F1i)
+        return F1i
 
     def built_Fi(self):
-        self.Fi_log = []
-        self.Fi = list()
-        for i in range(self.dim[3]):
-            self.Fi_log.append(self.built_F1i(self.Psi_log[i], self.a[:, i]))
-            self.Fi.append(np.exp(self.Fi_log[-1]) - 1 - self.OFFSET)
+        self.Fi_log = self.built_F1i(self.Psi_log, self.a)  # stack of matrices Fi, one for each Y
+        self.Fi = np.exp(self.Fi_log) - 1 - self.OFFSET
 
     def built_c(self):
-        self.c = np.ndarray(shape=(len(self.X), 0), dtype=float)
-        for i in range(self.dim[3]):
-            self.c = np.append(self.c, self._minimize_equation(self.Fi_log[i], np.log(self.Y[:, i] + 1 + self.OFFSET))
-                               , axis=1)
+        self.c = self._solve_outputs(self.Fi_log)
 
     def built_F(self):
-        F = np.ndarray(self.Y.shape, dtype=float)
-        for j in range(F.shape[1]):  # 2
-            for i in range(F.shape[0]):  # 50
-                F[i, j] = self.Fi_log[j][i, :] * self.c[:, j]
-        self.F_log = np.matrix(F)
+        self.F_log = np.einsum('rnj,jr->nr', self.Fi_log, self.c.astype(self.Fi_log.dtype, copy=False))
         self.F = np.exp(self.F_log) - 1
-        self.norm_error = []
-        for i in range(self.Y.shape[1]):
-            self.norm_error.append(np.linalg.norm(self.Y[:, i] - self.F[:, i], np.inf))
+        self.norm_error = np.abs(self.Y - self.F).max(axis=0).tolist()
 
     def built_F_(self):
         minY = self.Y_.min(axis=0)
@@ -284,6 +381,83 @@ class Solve(object):
         for i in range(self.Y_.shape[1]):
             self.error.append(np.linalg.norm(self.Y_[:, i] - self.F_[:, i], np.inf))
 
+    def _fold_grams(self, parts):
+        """
+        Gram matrices A_log.T*A_log and A_log.T*B_log of every fold, for nested basis they are computed once
+        for all degrees up to max_deg
+        :param parts: list of arrays of samples of folds
+        :return: tuple (list of G, list of AtB, columns of A_log in basis)
+        """
+        # pieces of nested basis outlive changes of deg, pieces of A_log go with it (see CACHES)
+        if self._uses_nested():
+            name, basis, columns = '_nested_fold_pieces', self._nested_basis()[1], self._nested_columns()[0]
+        else:
+            name, basis, columns = '_fold_pieces', self.A_log, list(range(self.A_log.shape[1]))
+        cached = getattr(self, name, None)
+        if cached is None or cached[0] is not basis or cached[1] is not self.B_log or cached[2] != len(parts):
+            pieces = [NestedLeastSquares.from_matrix(basis[rows], self.B_log[rows]) for rows in parts]
+            cached = (basis, self.B_log, len(parts), [piece.G for piece in pieces], [piece.AtB for piece in pieces])
+            setattr(self, name, cached)
+        return cached[3], cached[4], columns
+
+    def cross_validate(self):
+        """
+        Error of the model on samples it was not fitted on. Samples are split in folds of consecutive samples,
+        in 'kfold' mode every fold is tested on the model fitted on all other folds, in 'time' mode every fold
+        but the first is tested on the model fitted on preceding folds only.
+        Lamb of a fold is solved from sums of Gram matrices of folds (see _fold_grams), so folds cost
+        no more passes over A_log than one fit; a and c are fitted on train samples
+        :return: cv_error, max |Y - F| over test samples for every output, None if folds < 2
+        """
+        if self.folds < 2:
+            self.cv_error = None
+            return
+        parts = np.array_split(np.arange(self.Y.shape[0]), self.folds)
+        G, AtB, columns = self._fold_grams(parts)
+        error = np.zeros(self.Y.shape[1])
+        for f in range(1 if self.cv_mode == 'time' else 0, len(parts)):
+            train = list(range(f)) if self.cv_mode == 'time' else [t for t in range(len(parts)) if t != f]
+            solver = NestedLeastSquares(sum(G[t] for t in train)[np.ix_(columns, columns)],
+                                        sum(AtB[t] for t in train)[columns])
+            fold = copy(self)  # shares everything up to built_A, stages from lamb on are computed for the fold
+            fold._fit_rows = np.concatenate([parts[t] for t in train])
+            fold.Lamb = self._gram_lamb(solver)
+            error = np.maximum(error, np.abs(self.Y[parts[f]] - fold.F[parts[f]]).max(axis=0))
+        self.cv_error = error.tolist()
+
+    def _gram_lamb(self, solver):
+        """
+        :param solver: NestedLeastSquares of Gram matrices of columns of A_log
+        :return: Lamb, solved separately for X1, X2, X3 in lambda_multiblock mode
+        """
+        boundaries = [0, self.A_log.shape[1]]
+        if self.splitted_lambdas:
+            boundaries[1:1] = np.cumsum([self.deg[k] * self.dim[k] for k in range(len(self.X) - 1)]).tolist()
+        return np.vstack([solver.solve(range(boundaries[k], boundaries[k + 1])) for k in range(len(boundaries) - 1)])
+
+    def refit(self, rows=None, Y=None):
+        """
+        Copy of the model with Lamb, a and c fitted again, A and its factorization are shared with this model
+        :param rows: samples to fit on, repeated samples are weighted by number of repetitions; None for all
+        :param Y: normalized outputs to fit instead of Y
+        :return: Solve with F for all samples and calculate_values of the new coefficients
+        """
+        fit = copy(self)
+        if Y is not None:
+            fit.__dict__['Y'] = Y
+            fit.invalidate('built_B')  # B and stages from lamb on, A is kept
+        if rows is not None:
+            fit._fit_rows = rows
+            fit.Lamb = fit._gram_lamb(NestedLeastSquares.from_matrix(fit.A_log[rows], fit.B_log[rows]))
+        return fit
+
+    def save_model(self, filename):
+        """
+        Saves coefficients and ranges of the model without training data, see model.Model.load
+        :param filename: .npz file
+        """
+        Model.from_solver(self).save(filename)
+
     def save_to_file(self):
         if self.filename_output == '':
             return
@@ -296,71 +470,71 @@ class Solve(object):
 
         ws.append(['Input data: X'])
         for i in range(self.n):
-            ws.append(l + self.datas[i, :self.dim_integral[3]].tolist()[0])
+            ws.append(l + self.datas[i, :self.dim_integral[3]].tolist())
         ws.append([])
 
         ws.append(['Input data: Y'])
         for i in range(self.n):
-            ws.append(l + self.datas[i, self.dim_integral[2]:self.dim_integral[3]].tolist()[0])
+            ws.append(l + self.datas[i, self.dim_integral[2]:self.dim_integral[3]].tolist())
         ws.append([])
 
         ws.append(['X normalized:'])
         for i in range(self.n):
-            ws.append(l + self.data[i, :self.dim_integral[2]].tolist()[0])
+            ws.append(l + self.data[i, :self.dim_integral[2]].tolist())
         ws.append([])
 
         ws.append(['Y normalized:'])
         for i in range(self.n):
-            ws.append(l + self.data[i, self.dim_integral[2]:self.dim_integral[3]].tolist()[0])
+            ws.append(l + self.data[i, self.dim_integral[2]:self.dim_integral[3]].tolist())
         ws.append([])
 
         ws.append(['matrix B:'])
         for i in range(self.n):
-            ws.append(l + self.B[i].tolist()[0])
+            ws.append(l + self.B[i].tolist())
         ws.append([])
 
         ws.append(['matrix A:'])
         for i in range(self.A.shape[0]):
-            ws.append(l + self.A[i].tolist()[0])
+            ws.append(l + self.A[i].tolist())
         ws.append([])
 
         ws.append(['matrix Lambda:'])
         for i in range(self.Lamb.shape[0]):
-            ws.append(l + self.Lamb[i].tolist()[0])
+            ws.append(l + self.Lamb[i].tolist())
         ws.append([])
 
         for j in range(len(self.Psi)):
             s = 'matrix Psi%i:' % (j + 1)
             ws.append([s])
             for i in range(self.n):
-                ws.append(l + self.Psi[j][i].tolist()[0])
+                ws.append(l + self.Psi[j][i].tolist())
             ws.append([])
 
         ws.append(['matrix a:'])
         for i in range(self.mX):
-            ws.append(l + self.a[i].tolist()[0])
+            ws.append(l + self.a[i].tolist())
         ws.append([])
 
         for j in range(len(self.Fi)):
             s = 'matrix F%i:' % (j + 1)
             ws.append([s])
             for i in range(self.Fi[j].shape[0]):
-                ws.append(l + self.Fi[j][i].tolist()[0])
+                ws.append(l + self.Fi[j][i].tolist())
             ws.append([])
 
         ws.append(['matrix c:'])
         for i in range(len(self.X)):
-            ws.append(l + self.c[i].tolist()[0])
+            ws.append(l + self.c[i].tolist())
         ws.append([])
 
         ws.append(['Y rebuilt normalized :'])
         for i in range(self.n):
-            ws.append(l + self.F[i].tolist()[0])
+            ws.append(l + self.F[i].tolist())
         ws.append([])
 
         ws.append(['Y rebuilt normalized :'])
         for i in range(self.n):
-            ws.append(l + self.F_[i].tolist()[0])
+            ws.append(l + self.F_[i].tolist())
         ws.append([])
 
         ws.append(['Error normalized (Y - F)'])
@@ -375,70 +549,82 @@ class Solve(object):
     def aggregate(self, values, coeffs):
         return np.exp(np.dot(np.log(1 + values + self.OFFSET), coeffs)) - 1
 
+    def calculate_values(self, X):
+        """
+        Model in many points at once
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: ndarray (m, outputs) of values in original scale
+        """
+        X = self._normalize_points(np.array(X, dtype=float, ndmin=2))
+        return self._evaluate_points(X) * (self.maxY - self.minY) + self.minY
+
     def calculate_value(self, X):
-        def calculate_polynomials(value, deg_lim):  # deg_lim is not reached
-            return np.array([self.poly_f(deg, value) for deg in range(deg_lim)]).T
-
-        X = np.array(X)
-        X = (X - self.minX) / (self.maxX - self.minX)
-        X = np.ma.array(X, mask= X < 0, fill_value=0.000000000000001).filled()
-        for i in range(len(X)):
-            if np.isnan(X[i]):
-                X[i] = 1
-        X = np.split(X, self.dim_integral[:2])
-        phi = np.array([calculate_polynomials(vector, self.deg[i]) for i, vector in enumerate(X)])
-        psi = list()
+        return self.calculate_values([X])[0]
+
+    def calculate_jacobians(self, X):
+        """
+        Derivatives of calculate_values by components of points, see model.Model.calculate_jacobians
+        :param X: array (m, mX) of points in original scale, or one point
+        :return: ndarray (m, outputs, mX), [p, i, s] is derivative of Y_i by x_s in point p
+        """
+        return Model.from_solver(self).calculate_jacobians(X)
+
+    def _normalize_points(self, X):
+        """
+        :param X: ndarray (m, mX) of points in original scale
+        :return: points scaled as X in norm_data (see CLAMP_POINTS and FILL_NAN_POINTS)
+        """
+        return normalize_points(X, self.minX, self.maxX, self.CLAMP_POINTS, self.FILL_NAN_POINTS)
+
+    def _evaluate_points(self, X):
+        """
+        Model in normalized points, every aggregate is applied to all points at once
+        :param X: ndarray (m, mX) of normalized points
+        :return: ndarray (m, outputs) of normalized values
+        """
+        if self.use_kernels and self.poly_type in b_gen.RECURRENCES:
+            return kernels.evaluate(self.poly_type, X, np.repeat(self.deg, self.dim[:3]), self.dim[:3], self.Lamb,
+                                    self.a, self.c, self.FAMILY, self.OFFSET)
+        outputs = self.dim[3]
+        psi = np.empty((X.shape[0], X.shape[1], outputs))
         shift = 0
+        s = 0  # component of X
         for i in range(3):
             for j in range(self.dim[i]):
-                psi.append(self.aggregate(phi[i][j], self.Lamb.A[shift: shift + self.deg[i]]))
+                phi = np.array([self.poly_f(deg, X[:, s]) for deg in range(self.deg[i])]).T
+                psi[:, s] = self.aggregate(phi, self.Lamb[shift: shift + self.deg[i]])
                 shift += self.deg[i]
-        psi = np.array(psi).T
-        big_phi = list()
+                s += 1
+        bounds = [0] + self.dim_integral[:3]
+        big_phi = np.empty((X.shape[0], 3, outputs))
         for i in range(3):
-            big_phi.append([self.aggregate(psi[k, (self.dim_integral[i - 1] if i > 0 else 0): self.dim_integral[i]],
-                                           self.a.A[(self.dim_integral[i - 1] if i > 0 else 0):
-                                           self.dim_integral[i], k]) for k in range(self.dim[3])])
-        big_phi = np.array(big_phi).T
-        result = np.array([self.aggregate(big_phi[k], self.c.A[:, k]) for k in range(self.dim[3])])
-        result = result * (self.maxY - self.minY) + self.minY
-        return result
+            block = slice(bounds[i], bounds[i + 1])
+            for k in range(outputs):
+                big_phi[:, i, k] = self.aggregate(psi[:, block, k], self.a[block, k])
+        return np.stack([self.aggregate(big_phi[:, :, k], self.c[:, k]) for k in range(outputs)], axis=1)
 
-    def build_predicted(self):
+    def forecast_points(self):
+        """
+        :return: (forecasts of components of X1, X2, X3, points (pred_step, mX) Y is predicted in)
+        """
         XF = list()
         for i, x in enumerate(self.X_):
             xf = list()
             for j, xc in enumerate(x.T):
                 # crutch for adequate forecast
-                diff = xc[0, -1] - xc[0, -self.pred_step - 1]
-                xf.append(xc.getA1()[-10:] + diff)
-                # xf.append(forecast(xc.getA1(), self.pred_step))
+                diff = xc[-1] - xc[-self.pred_step - 1]
+                xf.append(xc[-10:] + diff)
+                # xf.append(forecast(xc, self.pred_step))
             XF.append(xf)
-        yf = list()
-        for s in range(1, self.pred_step + 1):
-            x = list()
-            for xf in XF:
-                for xfc in xf:
-                    x.append(xfc[-s])
-            yf.append(self.calculate_value(x)) #y depend on all x
+        x = [[xfc[-s] for xf in XF for xfc in xf] for s in range(1, self.pred_step + 1)] #y depend on all x
+        return XF, np.array(x)
+
+    def build_predicted(self):
+        XF, x = self.forecast_points()
         self.XF = XF
-        self.YF = np.array(yf).flatten() #flatten because one y
+        self.YF = self.calculate_values(x).flatten() #flatten because one y
 
 
     def prepare(self):
-        self.norm_data()
-        self.define_norm_vectors()
-        self.built_B()
-        self.poly_func()
-        self.built_A()
-        self.lamb()
-        self.psi()
-        self.built_a()
-        self.built_Fi()
-        self.built_c()
-        self.built_F()
-        self.built_F_()
+        self.compute()
         self.save_to_file()
-        self.build_predicted()
-
-